@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+# persistent index of the bar sequences and sheets already generated, so a corpus never repeats one
+import sys
+import sqlite3
+import hashlib
+from array import array
+
+class BarIndex:
+    ''' fingerprints of what was generated, by kind:
+            bars   --> every window of `window` consecutive bars of a staff
+            sheets --> every whole sheet
+        A fingerprint is a signed 64 bit integer: the first 8 bytes of a
+        blake2b of the notes for a sheet, and for a window of bars a
+        polynomial of the barPrint of the text of its bars, so a window is one multiply
+        and add from the one before it (see windowPrint).
+        They are stored in an SQLite file as blocks of packed integers, one
+        row per commit, and all read into a set when the index is opened: a
+        lookup is a set probe and a commit one insert. The set costs about
+        70 bytes a fingerprint, some 70 MB for a million bars of a staff.
+        The window and the fingerprint version are fixed when the file is
+        made. Several processes can share the file, each sees what was
+        committed before it opened it
+    '''
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS blocks (kind TEXT, data BLOB)',
+              'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)')
+    KINDS = ('bars', 'sheets')
+    # fingerprints kept in memory before they are written
+    PENDING = 1<<16
+    # of the fingerprints, an index made with another one is refused
+    VERSION = 2
+    # odd, the window polynomial is taken mod 2**64
+    MULTIPLIER = 0x9E3779B97F4A7C15
+    MASK = (1<<64) - 1
+
+    def __init__(self, path, window=4):
+        self.db = sqlite3.connect(path)
+        # one writer at a time, readers go on, a crash loses the last block only
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        for sql in BarIndex.SCHEMA:
+            self.db.execute(sql)
+        version = self.db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if version is None and self.db.execute('SELECT 1 FROM blocks LIMIT 1').fetchone() is not None:
+            # made before the version was kept
+            version = (1,)
+        if version is not None and version[0] != BarIndex.VERSION:
+            self.db.close()
+            raise ValueError("%s holds version %s fingerprints, this makes version %d: start a new index"
+                             % (path, version[0], BarIndex.VERSION))
+        self.db.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('version', BarIndex.VERSION))
+        self.db.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('window', window))
+        self.window = self.db.execute("SELECT value FROM meta WHERE name = 'window'").fetchone()[0]
+        self.db.commit()
+        self.known = dict((kind, set()) for kind in BarIndex.KINDS)
+        for kind, data in self.db.execute('SELECT kind, data FROM blocks'):
+            self.known[kind].update(BarIndex.unpack(data))
+        # added since the last commit
+        self.pending = dict((kind, []) for kind in BarIndex.KINDS)
+
+    @classmethod
+    def fingerprint(cls, data):
+        ''' fingerprint of the bytes data '''
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+    @classmethod
+    def barKey(cls, pitches, durations):
+        ''' bytes of one bar of TN indexes and DURATIONS codes '''
+        return bytes(pitches) + b'/' + bytes(durations) + b';'
+
+    @classmethod
+    def barPrint(cls, text):
+        ''' unsigned 64 bit fingerprint of one bar from its LilyPond text, the
+            terms of windowPrint. Bars that read the same are the same bar
+            (a rest keeps no pitch)
+        '''
+        return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+    @classmethod
+    def barTerms(cls, text, window):
+        ''' what the bar of text adds to a window of window bars at each
+            position: barPrint * MULTIPLIER**(window-1-i) mod 2**64 at i, so
+            a window is the sum of the terms of its bars mod 2**64
+        '''
+        fp = cls.barPrint(text)
+        return tuple((fp * pow(cls.MULTIPLIER, window - 1 - i, 1<<64)) & cls.MASK for i in range(0, window))
+
+    @classmethod
+    def windowPrint(cls, prints):
+        ''' fingerprint of a window of bars from the barPrint of each:
+            the sum of prints[i] * MULTIPLIER**(len-1-i) mod 2**64, signed.
+            The next window is (unsigned - first * MULTIPLIER**(len-1)) *
+            MULTIPLIER + next, mod 2**64
+        '''
+        fp = 0
+        for p in prints:
+            fp = (fp * cls.MULTIPLIER + p) & cls.MASK
+        return cls.signed(fp)
+
+    @classmethod
+    def signed(cls, fp):
+        ''' a 64 bit unsigned fingerprint as the signed integer stored '''
+        return fp - ((fp & (1<<63)) << 1)
+
+    @classmethod
+    def pack(cls, fps):
+        ''' fingerprints as little endian bytes '''
+        packed = array('q', fps)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return packed.tobytes()
+
+    @classmethod
+    def unpack(cls, data):
+        fps = array('q')
+        fps.frombytes(data)
+        if sys.byteorder == 'big':
+            fps.byteswap()
+        return fps
+
+    def seen(self, fps, kind='bars'):
+        ''' the fingerprints of fps already in the index '''
+        return self.known[kind].intersection(fps)
+
+    def add(self, fps, kind='bars'):
+        known = self.known[kind]
+        new = set(fps) - known
+        known.update(new)
+        self.pending[kind].extend(new)
+
+    def sync(self):
+        ''' commit once PENDING fingerprints are waiting '''
+        if max(len(fps) for fps in self.pending.values()) >= BarIndex.PENDING:
+            self.commit()
+
+    def commit(self):
+        ''' write the fingerprints added since the last commit '''
+        for kind, fps in self.pending.items():
+            if fps:
+                self.db.execute('INSERT INTO blocks VALUES (?, ?)', (kind, BarIndex.pack(fps)))
+        self.db.commit()
+        self.pending = dict((kind, []) for kind in BarIndex.KINDS)
+
+    def count(self, kind='bars'):
+        return len(self.known[kind])
+
+    def close(self):
+        self.commit()
+        self.db.close()
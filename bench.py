@@ -0,0 +1,156 @@
+#!/usr/bin/python
+
+# the program is to time the note generation and template formatting of gen3.py ... gen8.py
+import io
+import sys
+import time
+import json
+import argparse
+import platform
+import importlib
+import tracemalloc
+from contextlib import redirect_stdout
+
+class SeedClock:
+    ''' stands in for datetime in the old generators: they seed with
+        random.seed(datetime.now()), which Python 3.11 rejects, so hand them
+        the current time as a float
+    '''
+    @staticmethod
+    def now():
+        return time.time()
+
+# what each generation takes: -n in notes or bars, level as int or (treble, bass),
+# whether it knows -u and which formats it prints
+GENERATORS = {
+    'gen3':{'notes':'notes', 'level':None,    'unique':False, 'formats':['Grand', '2Treble']},
+    'gen4':{'notes':'notes', 'level':None,    'unique':False, 'formats':['Grand', '2Treble']},
+    'gen5':{'notes':'bars',  'level':'int',   'unique':False, 'formats':['Grand', '2Treble']},
+    'gen6':{'notes':'bars',  'level':'int',   'unique':True,  'formats':['Grand', '2Treble']},
+    'gen7':{'notes':'bars',  'level':'tuple', 'unique':True,  'formats':['Grand', '2Treble']},
+    'gen8':{'notes':'bars',  'level':'tuple', 'unique':True,  'formats':['Grand', '2Treble', 'Beats']},
+}
+
+def loadGenerator(name):
+    ''' import genN.py, None if it does not load (gen4.py is unfinished) '''
+    try:
+        mod = importlib.import_module(name)
+    except SyntaxError as e:
+        print("%s: skipped, %s" % (name, e), file=sys.stderr)
+        return None
+    if hasattr(mod, 'datetime'):
+        mod.datetime = SeedClock
+    return mod
+
+def cases(name, mod, sizes, formats, uniques):
+    ''' every (bars, time, level, format, unique) the generator supports '''
+    spec = GENERATORS[name]
+    if spec['level'] is None:
+        levels = [(4, None)]
+    else:
+        levels = sorted(getattr(mod.SightGen, 'R4Dict', {}).keys())
+    for bars in sizes:
+        for beats, level in levels:
+            for format in spec['formats']:
+                if formats and format not in formats:
+                    continue
+                for unique in uniques:
+                    if unique and not spec['unique']:
+                        continue
+                    yield bars, beats, level, format, unique
+
+def makeGen(name, mod, bars, beats, level, format, unique):
+    spec = GENERATORS[name]
+    # ranges wide enough for every generation, -u needs two notes at least
+    kwargs = {'format':format, 'tRange':(21, 25), 'bRange':(14, 18), 'barPerLine':4}
+    kwargs['notes'] = bars * 4 if spec['notes'] == 'notes' else bars
+    if spec['level'] is not None:
+        kwargs['time'] = beats
+        kwargs['level'] = level if spec['level'] == 'int' else (level, level)
+    if spec['unique']:
+        kwargs['differentNote'] = unique
+    return mod.SightGen(**kwargs)
+
+def printSheet(gen):
+    ''' run the print method of the format, output goes to a StringIO '''
+    sink = io.StringIO()
+    with redirect_stdout(sink):
+        {'Grand':gen.printGrand, '2Treble':gen.print2Treble,
+         'Beats':getattr(gen, 'printBeats', None)}[gen.format]()
+    return sink.tell()
+
+def runCase(name, mod, bars, beats, level, format, unique, repeat):
+    ''' best of repeat timings of genNotes and of the print method, then one
+        traced run for the peak memory and the blocks the sheet holds
+    '''
+    genSeconds, printSeconds, size = [], [], 0
+    for i in range(0, repeat):
+        gen = makeGen(name, mod, bars, beats, level, format, unique)
+        start = time.perf_counter()
+        gen.genNotes()
+        genSeconds.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        size = printSheet(gen)
+        printSeconds.append(time.perf_counter() - start)
+    del gen
+
+    tracemalloc.start()
+    gen = makeGen(name, mod, bars, beats, level, format, unique)
+    gen.genNotes()
+    printSheet(gen)
+    _, peak = tracemalloc.get_traced_memory()
+    # taken while the generator is alive, the blocks allocated since the
+    # start that it and its sheet still hold
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    del gen, snapshot
+
+    return {'generator':name, 'bars':bars, 'time':beats, 'level':level, 'format':format,
+            'unique':unique, 'genSeconds':min(genSeconds), 'printSeconds':min(printSeconds),
+            'barsPerSecond':bars / min(genSeconds) if min(genSeconds) > 0 else None,
+            'bytes':size, 'peakBytes':peak, 'allocatedBlocks':blocks}
+
+def caseKey(result):
+    return (result['generator'], result['bars'], result['time'], result['level'],
+            result['format'], result['unique'])
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the sheet generators")
+    parser.add_argument('-g', '--generator', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('-n', '--number', nargs='+', type=int, default=[64, 1024, 8192], help='sheet sizes in bars')
+    parser.add_argument('-f', '--format', nargs='+', default=None, help='formats, default all of each generator')
+    parser.add_argument('-u', '--unique', choices=['on', 'off', 'both'], default='both', help='-u sweep')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timed runs per case, the best counts')
+    parser.add_argument('-o', '--output', default=None, help='write the results as json to this file')
+    parser.add_argument('-c', '--compare', default=None, help='json of an earlier run to compare with')
+    args = parser.parse_args()
+
+    uniques = {'on':[True], 'off':[False], 'both':[False, True]}[args.unique]
+    baseline = {}
+    if args.compare is not None:
+        baseline = dict((caseKey(r), r) for r in json.load(open(args.compare))['results'])
+
+    results = []
+    print("%-5s %6s %5s %-7s %-6s %12s %9s %9s %10s" % ('gen', 'bars', 'level', 'format', 'unique',
+          'bars/s', 'gen ms', 'print ms', 'peak KB'))
+    for name in args.generator:
+        mod = loadGenerator(name)
+        if mod is None:
+            continue
+        for bars, t, level, format, unique in cases(name, mod, args.number, args.format, uniques):
+            r = runCase(name, mod, bars, t, level, format, unique, args.repeat)
+            results.append(r)
+            line = "%-5s %6d %5s %-7s %-6s %12.0f %9.2f %9.2f %10.1f" % (name, bars,
+                    '%s/%s' % (t, level), format, unique, r['barsPerSecond'] or 0,
+                    r['genSeconds'] * 1000, r['printSeconds'] * 1000, r['peakBytes'] / 1024.0)
+            old = baseline.get(caseKey(r))
+            if old is not None and old['genSeconds'] > 0:
+                line += "  x%.2f" % (old['genSeconds'] / r['genSeconds'])
+            print(line)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python':platform.python_version(), 'machine':platform.machine(),
+                       'date':time.strftime('%Y-%m-%d %H:%M:%S'), 'results':results}, f, indent=1)
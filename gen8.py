@@ -1,9 +1,261 @@
 #!/usr/bin/python
 
 # the program is to generate random notes for treble/bass clef to imporve the sight reading skill
+import os
+import sys
 import random
 import argparse
-from datetime import datetime
+import hashlib
+import json
+import math
+import copy
+import time
+import shutil
+from array import array
+from functools import lru_cache
+from itertools import accumulate
+
+from sheetcache import SheetCache
+from rhythm import barForms, AliasTable
+from barindex import BarIndex
+
+class SheetStats:
+    ''' wall time per phase and counters of one run (--stats).
+        phases:   rng     --> drawing forms and pitches
+                  build   --> rendering notes and bars to text
+                  join    --> rendering and joining the bars in genNotes
+                  format  --> %-formatting the template in print*
+                  write   --> writing the template and bars in streamSheet
+        counters: draws, retries, bars, notes, bytes
+        The generators update it once per chunk, and only when a SightGen
+        has one, so a run without --stats pays nothing.
+    '''
+    def __init__(self):
+        self.seconds = {}
+        # the samplers never reject a draw, retries stays 0 unless a caller
+        # re-draws
+        self.counts = {'retries':0}
+
+    def lap(self, phase, start):
+        ''' add the time since start to phase, returns the time now '''
+        now = time.perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - start
+        return now
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self):
+        return {'seconds':dict((k, round(v, 6)) for k, v in self.seconds.items()),
+                'counts':self.counts}
+
+class CountingWriter:
+    ''' file object wrapper that counts the characters written through it '''
+    def __init__(self, out, stats):
+        self.out = out
+        self.stats = stats
+
+    def write(self, s):
+        self.stats.counts['bytes'] = self.stats.counts.get('bytes', 0) + len(s)
+        return self.out.write(s)
+
+class Staff:
+    ''' the notes of one staff as compact arrays
+            name      --> 'treble', 'bass' or 'rhythm'
+            pitches   --> uint8 index into SightGen.TN of each note
+            durations --> uint8 index into SightGen.DURATIONS of each note
+            bars      --> uint32 offset of the first note of each bar and
+                          the note count at the end, bar k is the notes
+                          bars[k]:bars[k+1]
+    '''
+    __slots__ = ('name', 'pitches', 'durations', 'bars')
+
+    def __init__(self, name):
+        self.name = name
+        self.pitches = array('B')
+        self.durations = array('B')
+        self.bars = array('I', [0])
+
+    def extend(self, pitches, durations, lengths):
+        ''' append bars, lengths holds the number of notes of each one '''
+        self.pitches.extend(pitches)
+        self.durations.extend(durations)
+        self.bars.extend(accumulate(lengths, initial=self.bars[-1]))
+        # accumulate repeats the initial offset
+        self.bars.pop(len(self.bars) - len(lengths) - 1)
+
+    def numBars(self):
+        return len(self.bars) - 1
+
+    def bar(self, k):
+        ''' (pitches, durations) of bar k '''
+        begin, end = self.bars[k], self.bars[k+1]
+        return self.pitches[begin:end], self.durations[begin:end]
+
+    def notes(self, k):
+        ''' the notes of bar k as (pitch, duration) LilyPond names, the
+            pitch is None for a rest
+        '''
+        pitches, durations = self.bar(k)
+        return [(SightGen.TN[p] if d < SightGen.REST else None, SightGen.DURATIONS[d])
+                for p, d in zip(pitches, durations)]
+
+    def iterBars(self, barPerLine=0, first=0, last=None):
+        ''' LilyPond text of the bars first..last-1, rendered CHUNK bars at a
+            time, a '\\break' follows every barPerLine bars
+        '''
+        last = self.numBars() if last is None else last
+        bars = self.bars
+        for begin in range(first, last, SightGen.CHUNK):
+            end = min(begin + SightGen.CHUNK, last)
+            lengths = [bars[k+1] - bars[k] for k in range(begin, end)]
+            yield from SightGen.lilyBars(self.pitches[bars[begin]:bars[end]],
+                                         self.durations[bars[begin]:bars[end]],
+                                         lengths, begin, barPerLine)
+
+class Sheet:
+    ''' a generated sheet: the format, time signature (time/unit) and
+        barPerLine it was made with and one Staff per staff. Text is made
+        only when it is written, by writeLilypond or another writer
+    '''
+    __slots__ = ('format', 'time', 'unit', 'barPerLine', 'staffs')
+
+    def __init__(self, format, time, unit, barPerLine):
+        self.format = format
+        self.time = time
+        self.unit = unit
+        self.barPerLine = barPerLine
+        self.staffs = []
+
+    def signature(self):
+        return '%d/%d' % (self.time, self.unit)
+
+    def numBars(self):
+        return self.staffs[0].numBars() if self.staffs else 0
+
+    def breaks(self):
+        ''' numbers of the bars a line break follows '''
+        if self.barPerLine == 0:
+            return []
+        return list(range(self.barPerLine - 1, self.numBars(), self.barPerLine))
+
+    def staff(self, name):
+        ''' the Staff called name: 'treble', 'bass' or 'rhythm' '''
+        for staff in self.staffs:
+            if staff.name == name:
+                return staff
+        raise KeyError(name)
+
+    def toDict(self):
+        ''' the sheet as plain values (for json), every bar a list of
+            [pitch, duration] in LilyPond names, pitch null for a rest
+        '''
+        return {'format':self.format, 'time':self.signature(), 'barPerLine':self.barPerLine,
+                'breaks':self.breaks(),
+                'staffs':[{'name':staff.name,
+                           'bars':[[list(note) for note in staff.notes(k)]
+                                   for k in range(0, staff.numBars())]}
+                          for staff in self.staffs]}
+
+    def write(self, out):
+        ''' write the sheet as the LilyPond file of its format to out '''
+        writeLilypond(self, out)
+
+class BarCoder:
+    ''' numbers every bar a staff can play. A bar is a form (index into the
+        form list) and a code in range(sizes[form]), one draw each. The
+        digits of the code, base the range size, are the notes of the bar,
+        rests take no digit and keep the slot of the note before.
+        With different notes the digits are in base size-1 and each note
+        steps 1 to size-1 slots forward from the note before it, wrapping
+        around: a uniform pick among the other notes, so no draw is ever
+        rejected.
+        When the bars of all forms fit in limit, their text is enumerated
+        once into table and a bar is a single lookup, otherwise each bar is
+        built note by note. Both give the same bar for the same draws.
+    '''
+    __slots__ = ('low', 'size', 'base', 'forms', 'sizes', 'unique', 'exact', 'table')
+
+    def __init__(self, low, high, forms, unique, limit):
+        self.low = low
+        self.size = high - low + 1
+        self.base = self.size - 1 if unique else self.size
+        self.forms = forms
+        self.sizes = [self.base ** len([d for d in form if d < SightGen.REST]) for form in forms]
+        self.unique = unique
+        # random() * size is only uniform while size is well below 2**53
+        self.exact = max(self.sizes) > 1<<32
+        entries = sum(self.sizes) * (self.size if unique else 1)
+        self.table = None
+        if entries <= limit:
+            if unique:
+                self.table = [[[self.build(f, code, last) for code in range(self.sizes[f])]
+                               for f in range(len(forms))] for last in range(self.size)]
+            else:
+                self.table = [[self.build(f, code, 0) for code in range(self.sizes[f])]
+                              for f in range(len(forms))]
+
+    @classmethod
+    @lru_cache(maxsize=32)
+    def get(cls, low, high, forms, unique, limit):
+        ''' shared coder of a (range, forms, different notes) combination '''
+        return cls(low, high, forms, unique, limit)
+
+    def draw(self, rng, forms):
+        ''' one code for each form index of forms '''
+        sizes = self.sizes
+        if self.exact:
+            return [rng.randrange(sizes[f]) if sizes[f] > 1 else 0 for f in forms]
+        random = rng.random
+        return [int(random() * sizes[f]) if sizes[f] > 1 else 0 for f in forms]
+
+    def build(self, form, code, last):
+        ''' (text, TN indexes) of a bar, last is the slot of the note before '''
+        pitches = []
+        for duration in self.forms[form]:
+            if duration < SightGen.REST:
+                code, digit = divmod(code, self.base)
+                last = (last + digit + 1) % self.size if self.unique else digit
+            pitches.append(self.low + last)
+        noteText = SightGen.NOTE_TEXT
+        return (''.join([noteText[pitch][duration] for pitch, duration in zip(pitches, self.forms[form])]),
+                tuple(pitches))
+
+    def bar(self, form, code, last):
+        ''' (text, TN indexes) of a bar, from the table when there is one '''
+        if self.table is None:
+            return self.build(form, code, last)
+        if self.unique:
+            return self.table[last][form][code]
+        return self.table[form][code]
+
+class StaffPlan:
+    ''' what a staff needs before its first draw, worked out once per
+        configuration and shared by every sheet made from it
+            name    --> stream name, 'treble', 'bass' or 'rhythm'
+            low     --> TN index of the lowest note
+            forms   --> the forms as tuples of DURATIONS codes
+            coder   --> BarCoder of range, forms and different notes
+            sampler --> AliasTable of the form weights, None for uniform
+            unique  --> adjacent notes differ
+            terms   --> BarIndex.barTerms of the bars met with an index, by
+                        window and text
+    '''
+    __slots__ = ('name', 'low', 'forms', 'coder', 'sampler', 'unique', 'terms')
+
+    def __init__(self, name, clefRange, tFormList, weights, unique):
+        low, high = clefRange[0], clefRange[1]
+        if high < low:
+            raise ValueError("a range goes from its low note up, got %s" % (clefRange,))
+        if unique and high - low < 1:
+            raise ValueError("different notes need a range of 2 notes at least, got %s" % (clefRange,))
+        self.name = name
+        self.low = low
+        self.forms = SightGen.formCodes(tFormList)
+        self.coder = BarCoder.get(low, high, tuple(self.forms), unique, SightGen.TABLE_LIMIT)
+        self.sampler = None if weights is None else AliasTable(weights)
+        self.unique = unique
+        self.terms = {}
 
 class SightGen:
     ''' variables: tNotes --> List to hold the treble clef notes
@@ -29,6 +281,12 @@ class SightGen:
         "c'", "d'", "e'", "f'", "g'", "a'", "b'",
         "c''", "d''", "e''", "f''", "g''", "a''", "b''"]
 
+    # the durations a form can hold, a Staff stores the index of each,
+    # indexes from REST on are rests
+    DURATIONS = ['1', '2.', '2', '4.', '4', '8.', '8', '16', '1.',
+                 'r1.', 'r1', 'r2.', 'r2', 'r4.', 'r4', 'r8.', 'r8', 'r16']
+    REST = DURATIONS.index('r1.')
+
     R4Dict = {
             # 1/4 notes only
             (4,1):[['4', '4', '4','4'],],
@@ -62,10 +320,27 @@ class SightGen:
                 ],
              }
 
-    FORMAT_HEADER = r'''
+    # durations of each level, a bar of any time signature takes every
+    # form of them that fills it. 4/4 and 3/4 keep their R4Dict forms
+    LEVEL_DURATIONS = {
+            1:['4.', '4'],
+            2:['1.', '1', '2.', '2', '4.', '4'],
+            3:['1.', '1', '2.', '2'],
+            4:['2', '4.'],
+            5:['1.', '1', '2.', '2', '4.', '4'],
+            6:['2.', '2', '4.', '4', '8'],
+            7:['4.', '4', '8', 'r8'],
+        }
+
+    # most forms a level or durations option may have
+    MAX_FORMS = 1<<16
+
+    FORMAT_VERSION = '\\version "2.16.2"\n    '
+    FORMAT_PAPER = r'''
     #(set-default-paper-size "a4" 'landscape)
     #(set-global-staff-size 30)
-    \score
+'''
+    FORMAT_HEADER = FORMAT_PAPER + r'''    \score
     '''
     FORMAT_FOOTER = r'''
     \layout {
@@ -76,12 +351,12 @@ class SightGen:
     }
     '''
 
-    FORMAT_GRAND = '''\\version "2.16.2"
-    %s
+    # the music of one score of each format, the %s takes the footer
+    SCORE_GRAND = '''
     {
     \\new PianoStaff
         <<
-        \\new Staff { \\time %%s/4
+        \\new Staff { \\time %%s
                         %%s
                     }
         \\new Staff { \\clef "bass"
@@ -90,13 +365,12 @@ class SightGen:
         >>
     %s
     }
-    ''' % (FORMAT_HEADER, FORMAT_FOOTER)
+    '''
 
-    FORMAT_2TREBLE = '''\\version "2.16.2"
-    %s
+    SCORE_2TREBLE = '''
     {
     <<
-    \\new Staff { \\clef "treble" \\time %%s/4
+    \\new Staff { \\clef "treble" \\time %%s
                  %%s
                 }
     \\new Staff { \\clef "treble"
@@ -105,20 +379,37 @@ class SightGen:
     >>
     %s
     }
-    ''' % (FORMAT_HEADER, FORMAT_FOOTER)
-
+    '''
 
-    FORMAT_BEATS = '''\\version "2.16.2"
-    %s
+    SCORE_BEATS = '''
     {
     <<
-    \\new Staff { \\clef "treble" \\time \%%s/4
+    \\new Staff { \\clef "treble" \\time \%%s
                  %%s
                 }
     >>
     %s
     }
-    ''' % (FORMAT_HEADER, FORMAT_FOOTER)
+    '''
+
+    FORMAT_GRAND = FORMAT_VERSION + FORMAT_HEADER + SCORE_GRAND % FORMAT_FOOTER
+
+    FORMAT_2TREBLE = FORMAT_VERSION + FORMAT_HEADER + SCORE_2TREBLE % FORMAT_FOOTER
+
+    FORMAT_BEATS = FORMAT_VERSION + FORMAT_HEADER + SCORE_BEATS % FORMAT_FOOTER
+
+    FORMAT_TEMPLATE = {'Grand':FORMAT_GRAND, '2Treble':FORMAT_2TREBLE, 'Beats':FORMAT_BEATS}
+    SCORE_TEMPLATE = {'Grand':SCORE_GRAND, '2Treble':SCORE_2TREBLE, 'Beats':SCORE_BEATS}
+
+    # a book of many scores, one lilypond run engraves all of them
+    FORMAT_BOOK_HEADER = FORMAT_VERSION + FORMAT_PAPER + '    \\book {'
+    FORMAT_BOOK_SCORE = '''
+    \\score'''
+    FORMAT_SCORE_TITLE = '''
+    \\header { piece = "%s" }'''
+    FORMAT_BOOK_FOOTER = '''
+    }
+'''
 
 
     PROFILE = {
@@ -144,8 +435,25 @@ class SightGen:
 
     FORMAT = [ 'Grand', '2Treble', 'Beats']
 
+    # number of bars drawn in one batch
+    CHUNK = 512
+
+    # part of config(), bump it whenever a seed stops giving the same .ly
+    # (template or generator change) so cached and batch outputs are redone
+    VERSION = 3
+
+    # most bars a BarCoder enumerates into its table, past that bars are
+    # built note by note
+    TABLE_LIMIT = 1<<15
+
+    # most redraws of a bar or a sheet already in the index
+    DEDUP_TRIES = 16
+    # bar fingerprints a StaffPlan keeps for the index
+    TERM_CACHE = 1<<16
+
     def __init__(self, format='Grand', tRange=(0,4), bRange=(4,8), notes=16, barPerLine=4,
-                 time=4, level=(1,1), Profile=None, profile=None, differentNote=False):
+                 time=4, level=(1,1), Profile=None, profile=None, differentNote=False, seed=None,
+                 unit=4, durations=None):
 
         #List hold bars of each clef
         self.tBar, self.bBar = [], []
@@ -160,7 +468,20 @@ class SightGen:
             self.barPerLine = barPerLine
             self.time = time
             self.level = level
-            self.differentNote = differentNote
+
+        self.differentNote = differentNote
+        # note value of a beat, the time signature is time/unit
+        self.unit = unit
+        # durations of every form, 'duration' or 'duration:weight', None
+        # for the forms of the level
+        self.durations = durations
+        # seed of the staff streams, None for a fresh sheet every time
+        self.seed = seed
+        # SheetStats to fill in, None to run without instrumentation
+        self.stats = None
+        # BarIndex of the bar windows and sheets made before, None to not
+        # check. Seeded sheets then also depend on what it holds
+        self.index = None
 
         if type(Profile) == str:
             self.format =     SightGen.PROFILE[Profile][0]
@@ -172,7 +493,7 @@ class SightGen:
             self.level =      SightGen.PROFILE[Profile][6]
 
         if type(profile) == int:
-            p=SightGen.PROFILE.keys()[profile-1]
+            p=list(SightGen.PROFILE.keys())[profile-1]
             self.format =     SightGen.PROFILE[p][0]
             self.tRange =     SightGen.PROFILE[p][1]
             self.bRange =     SightGen.PROFILE[p][2]
@@ -181,95 +502,641 @@ class SightGen:
             self.time =       SightGen.PROFILE[p][5]
             self.level =      SightGen.PROFILE[p][6]
 
-        random.seed(datetime.now())
+    @classmethod
+    def chunkStream(cls, seed, name, chunk):
+        ''' random stream of chunk (CHUNK bars from bar chunk*CHUNK) of the
+            staff name: 'treble', 'bass' or 'rhythm'. Derived from seed and
+            the counter alone, so any chunk of any staff can be drawn first,
+            or in parallel, and still give the same sheet. Fresh when seed
+            is None
+        '''
+        if seed is None:
+            return random.Random()
+        return random.Random('%s:%s:%d' % (seed, name, chunk))
+
+    def config(self):
+        ''' everything that decides the sheet, as a dict of plain values '''
+        return {'format':self.format, 'tRange':list(self.tRange), 'bRange':list(self.bRange),
+                'numBars':self.numBars, 'barPerLine':self.barPerLine, 'time':self.time,
+                'level':list(self.level), 'differentNote':self.differentNote, 'seed':self.seed,
+                'unit':self.unit, 'durations':self.durations, 'version':SightGen.VERSION}
+
+    def configKey(self, *extra):
+        ''' hex digest of config(), equal keys make equal sheets when seeded.
+            extra tells apart other outputs of the same config (a book)
+        '''
+        config = self.config()
+        if extra:
+            config['extra'] = list(extra)
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
 
     def genClef(self, clef):
 
         # get the clif range
         # set the duration format list
-        if clef == self.tBar:
-            clefRange = self.tRange
-            tFormList = SightGen.R4Dict[(self.time, self.level[0])]
+        if clef is self.tBar:
+            plan = self.plans()[0]
+        else:
+            plan = self.plans()[1]
+
+        # a new sheet replaces the bars of the last one
+        clef[:] = self.iterText(plan, self.seed)
+
+    def signature(self):
+        ''' the time signature as LilyPond writes it, '4/4' '''
+        return '%d/%d' % (self.time, self.unit)
+
+    def rhythmForms(self, level):
+        ''' (form list, weights) of a staff at level: every form of the
+            durations option, else the R4Dict forms of (time, level) in 4/4
+            and 3/4, else every form of the LEVEL_DURATIONS of level.
+            weights is None for a uniform draw
+        '''
+        if self.durations is not None:
+            durations, weights = SightGen.parseDurations(self.durations)
+            forms = barForms(self.time, self.unit, durations, SightGen.MAX_FORMS)
+            if weights is None:
+                return forms, None
+            # a form weighs the product of the weights of its durations
+            return forms, [math.prod(weights[d] for d in form) for form in forms]
+        if self.unit == 4 and (self.time, level) in SightGen.R4Dict:
+            return SightGen.R4Dict[(self.time, level)], None
+        if level not in SightGen.LEVEL_DURATIONS:
+            raise ValueError("no level %s, levels are %s" % (level, sorted(SightGen.LEVEL_DURATIONS)))
+        return barForms(self.time, self.unit, SightGen.LEVEL_DURATIONS[level], SightGen.MAX_FORMS), None
+
+    def staffSpecs(self):
+        ''' (stream name, clef range, form list, weights, different notes)
+            of each staff of the format, the rhythm staff plays b' only
+        '''
+        if self.format == 'Beats':
+            beat = SightGen.TN.index("b'")
+            return [('rhythm', (beat, beat)) + self.rhythmForms(self.level[0]) + (False,)]
+        return [('treble', self.tRange) + self.rhythmForms(self.level[0]) + (self.differentNote,),
+                ('bass', self.bRange) + self.rhythmForms(self.level[1]) + (self.differentNote,)]
+
+    def plans(self):
+        ''' StaffPlan of each staff of staffSpecs(), made on the first call
+            and again only when the configuration changed
+        '''
+        key = (self.format, tuple(self.tRange), tuple(self.bRange), self.time, self.unit,
+               tuple(self.level), None if self.durations is None else tuple(self.durations),
+               self.differentNote, SightGen.TABLE_LIMIT)
+        plans = self.__dict__.get('planCache')
+        if plans is None or plans[0] != key:
+            plans = (key, [StaffPlan(*spec) for spec in self.staffSpecs()])
+            self.planCache = plans
+        return plans[1]
+
+    def drawChunk(self, plan, seed, chunk, before=None):
+        ''' (bars, last) of chunk of the staff of a StaffPlan: the bars as a
+            list of (text, TN indexes, form index) and the slot of its last
+            note. before is the slot of the last note ahead of the chunk,
+            None for the first chunk.
+            With different notes a chunk starts after a slot of its own, so
+            only a first note equal to before is drawn again: among the
+            slots other than before and the next note, or, with two slots,
+            by swapping the slots of the whole chunk
+        '''
+        low, unique, coder, sampler = plan.low, plan.unique, plan.coder, plan.sampler
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        rng = SightGen.chunkStream(seed, plan.name, chunk)
+        # draw every form and every bar code of a chunk in one batch
+        count = min(SightGen.CHUNK, self.numBars - chunk * SightGen.CHUNK)
+        last = rng.randrange(coder.size) if unique else 0
+        if sampler is None:
+            barForms = rng.choices(range(0, len(plan.forms)), k=count)
         else:
-            clefRange = self.bRange
-            tFormList = SightGen.R4Dict[(self.time, self.level[1])]
-
-
-        random.seed(datetime.now())
-        lastPitch = None
-        for k in range(0, self.numBars):
-            t = random.randrange(0, len(tFormList))
-            tForm = tFormList[t]
-            b = random.randrange(0, len(tFormList))
-            bForm = tFormList[b]
-
-            barString = ''
-            for i in range (0, len(tForm)):
-                # get random tNote
-                pitch = SightGen.TN[random.randrange(clefRange[0], clefRange[1]+1)]
-                while self.differentNote and pitch == lastPitch:
-                    pitch = SightGen.TN[random.randrange(clefRange[0], clefRange[1]+1)]
-                lastPitch = pitch
-                duration = tForm[i]
-                note = pitch + duration
-                barString = barString + note + ' '
-            clef.append(barString)
-            if self.barPerLine != 0 and (k+1) % self.barPerLine == 0:
-                clef.append('\\break')
+            barForms = sampler.draw(rng, count)
+        codes = coder.draw(rng, barForms)
+        if stats is not None:
+            start = stats.lap('rng', start)
+
+        bars = []
+        for form, code in zip(barForms, codes):
+            text, pitches = coder.bar(form, code, last)
+            last = pitches[-1] - low
+            bars.append((text, pitches, form))
+
+        if unique:
+            notes = [(k, n) for k, (_, _, form) in enumerate(bars)
+                     for n, duration in enumerate(plan.forms[form]) if duration < SightGen.REST][:2]
+            if not notes:
+                last = before if before is not None else last
+            elif before is not None and bars[notes[0][0]][1][notes[0][1]] - low == before:
+                last = self.redraw(plan, bars, notes, before, rng, last)
+        if stats is not None:
+            stats.lap('build', start)
+            stats.count('draws', count + len([f for f in barForms if coder.sizes[f] > 1]) + int(unique))
+            stats.count('bars', count)
+            stats.count('notes', sum(len(pitches) for _, pitches, _ in bars))
+        return bars, last
+
+    def redraw(self, plan, bars, notes, before, rng, last):
+        ''' give the first note of a chunk (notes holds the (bar, note) of its
+            first two notes) a slot other than before, returns the new slot
+            of the last note of the chunk
+        '''
+        low, size, forms = plan.low, plan.coder.size, plan.forms
+        if size == 2:
+            # two slots alternate, every note of the chunk changes side
+            for k, (_, pitches, form) in enumerate(bars):
+                pitches = tuple(low + 1 - (p - low) for p in pitches)
+                bars[k] = (SightGen.barText(pitches, forms[form]), pitches, form)
+            return 1 - last
+        (k, n) = notes[0]
+        taken = {before}
+        if len(notes) > 1:
+            taken.add(bars[notes[1][0]][1][notes[1][1]] - low)
+        else:
+            # the only note of the chunk is also its last one
+            last = None
+        slot = [s for s in range(0, size) if s not in taken][rng.randrange(size - len(taken))]
+        _, pitches, form = bars[k]
+        pitches = pitches[:n] + (low + slot,) + pitches[n+1:]
+        bars[k] = (SightGen.barText(pitches, forms[form]), pitches, form)
+        return slot if last is None else last
+
+    def entrySlot(self, plan, seed, chunk):
+        ''' slot of the last note ahead of chunk. Only a chunk with two notes
+            or more and more than two slots ends the same after any slot, so
+            the walk back stops at the first one and comes forward from it
+        '''
+        if chunk == 0:
+            return None
+        first = chunk - 1
+        while first > 0:
+            bars, _ = self.drawChunk(plan, seed, first)
+            notes = sum(1 for _, _, form in bars for d in plan.forms[form] if d < SightGen.REST)
+            if plan.coder.size > 2 and notes > 1:
+                break
+            first -= 1
+        before = None
+        for c in range(first, chunk):
+            before = self.drawChunk(plan, seed, c, before)[1]
+        return before
+
+    def iterChunks(self, plan, seed, first=0, last=None):
+        ''' generator of the bars of the staff of a StaffPlan, CHUNK bars at
+            a time, as lists of (text, TN indexes, form index), for the
+            chunks first..last-1. Forms are drawn by weights when the plan
+            has a sampler. With an index no window of bars comes out twice,
+            as far as DEDUP_TRIES redraws go
+        '''
+        if last is None:
+            last = -(-self.numBars // SightGen.CHUNK)
+        before = self.entrySlot(plan, seed, first) if plan.unique else None
+        # keys of the last bars, for the windows of the index
+        recent = []
+        for chunk in range(first, last):
+            bars, end = self.drawChunk(plan, seed, chunk, before)
+            if self.index is not None:
+                end = self.dedupChunk(plan, seed, chunk, bars, recent, before, end)
+            before = end
+            yield bars
+
+    def dedupChunk(self, plan, seed, chunk, bars, recent, before, last):
+        ''' redraw the bars of a chunk that end a window of index.window bars
+            already in the index, DEDUP_TRIES times at most, and add every
+            window to it. recent holds the barPrint of the bars ahead of the
+            chunk and is moved on to its end. before and last are the slots
+            of the last note ahead of the chunk and in it, the one returned
+            is after the redraws.
+            The windows are fingerprinted once for the whole chunk, each the
+            sum of the barTerms of its bars (see BarIndex.windowPrint), a
+            redraw adds its change to the windows it is in, nothing is
+            hashed again
+        '''
+        index, stats = self.index, self.stats
+        window, low, forms = index.window, plan.low, plan.forms
+        known = index.known['bars']
+        mask, sign = BarIndex.MASK, 1<<63
+        context = recent + self.barTerms(plan, bars, window)
+        offset, end = len(recent), len(recent) + len(bars)
+        # the unsigned fingerprint of every window ending in the chunk: the
+        # term of its first bar at position 0, of the next at 1, ...
+        first = max(offset, window - 1)
+        count, columns = end - first, list(zip(*context))
+        prints = [fp & mask for fp in map(sum, zip(*[columns[i][first+1-window+i:first+1-window+i+count]
+                                                    for i in range(0, window)]))]
+        fps = [fp - ((fp & sign) << 1) for fp in prints]
+        if known.isdisjoint(fps) and len(set(fps)) == len(fps):
+            # nothing to redraw, the common case
+            index.add(fps)
+            index.sync()
+            recent[:] = context[end+1-window:] if window > 1 else []
+            return last
+        added = set()
+        changed, rng = False, None
+        for w in range(0, len(prints)):
+            k = first - offset + w
+            fp = fps[w]
+            hit = fp in known or fp in added
+            tries = 0
+            while hit and tries < SightGen.DEDUP_TRIES:
+                tries += 1
+                if rng is None:
+                    rng = SightGen.chunkStream(seed, plan.name + ':dedup', chunk)
+                bar = self.redrawBar(plan, bars, k, before, rng)
+                if bar is None:
+                    continue
+                bars[k], changed = bar, True
+                terms, old = self.barTerms(plan, [bar], window)[0], context[offset+k]
+                context[offset+k] = terms
+                # the bar is at position window-1-d of the window ending d bars later
+                for d in range(0, min(window, len(prints) - w)):
+                    prints[w+d] = (prints[w+d] + terms[window-1-d] - old[window-1-d]) & mask
+                    fps[w+d] = prints[w+d] - ((prints[w+d] & sign) << 1)
+                fp = fps[w]
+                hit = fp in known or fp in added
+            if stats is not None and tries:
+                stats.count('redraws', tries)
+                stats.count('repeats', int(hit))
+            added.add(fp)
+        index.add(added)
+        index.sync()
+        recent[:] = context[end+1-window:] if window > 1 else []
+        if not changed or not plan.unique:
+            return last
+        # the last note may have been redrawn
+        for _, pitches, form in reversed(bars):
+            for pitch, duration in zip(reversed(pitches), reversed(forms[form])):
+                if duration < SightGen.REST:
+                    return pitch - low
+        return last
+
+    def barTerms(self, plan, bars, window):
+        ''' BarIndex.barTerms of each (text, TN indexes, form index) of bars,
+            kept by the plan as a table bar comes out again and again
+        '''
+        cache = plan.terms.setdefault(window, {})
+        texts = [text for text, _, _ in bars]
+        terms = list(map(cache.get, texts))
+        if None in terms:
+            if len(cache) >= SightGen.TERM_CACHE:
+                cache.clear()
+            for k, text in enumerate(texts):
+                if terms[k] is None:
+                    terms[k] = cache[text] = BarIndex.barTerms(text, window)
+        return terms
+
+    def redrawBar(self, plan, bars, k, before, rng):
+        ''' another (text, TN indexes, form index) for bar k of the bars of
+            a chunk, None when it would repeat the note after it. before
+            is the slot ahead of the chunk
+        '''
+        low, coder, unique = plan.low, plan.coder, plan.unique
+        form = plan.sampler.draw(rng, 1)[0] if plan.sampler is not None else rng.randrange(len(plan.forms))
+        if not unique:
+            start = 0
+        elif k > 0:
+            start = bars[k-1][1][-1] - low
+        else:
+            start = before if before is not None else rng.randrange(coder.size)
+        text, pitches = coder.bar(form, coder.draw(rng, [form])[0], start)
+        if unique:
+            for _, after, f in bars[k+1:]:
+                notes = [pitch for pitch, d in zip(after, plan.forms[f]) if d < SightGen.REST]
+                if notes:
+                    return None if notes[0] == pitches[-1] else (text, pitches, form)
+        return text, pitches, form
+
+    def iterText(self, plan, seed):
+        ''' generator of the bars of the staff of a StaffPlan as LilyPond
+            text, a '\\break' follows every barPerLine bars. Bars are drawn
+            CHUNK at a time so only one chunk of the staff is held in memory
+        '''
+        return self.lineText(self.iterChunks(plan, seed))
+
+    def lineText(self, chunks):
+        ''' generator of the text of the bars of chunks, lists of (text, TN
+            indexes, form index), a '\\break' after every barPerLine bars
+        '''
+        k = 0
+        for bars in chunks:
+            for text, _, _ in bars:
+                k += 1
+                yield text
+                if self.barPerLine != 0 and k % self.barPerLine == 0:
+                    yield '\\break'
 
     def genBeats(self, clef):
 
         # get the clif range
         # set the duration format list
-        if clef == self.tBar:
-            clefRange = self.tRange
-            tFormList = SightGen.R4Dict[(self.time, self.level[0])]
-
-        random.seed(datetime.now())
-        for k in range(0, self.numBars):
-            t = random.randrange(0, len(tFormList))
-            tForm = tFormList[t]
-            barString = ''
-            for i in range(0, len(tForm)):
-                # get random tNote
-                pitch = "b'"
-                lastPitch = pitch
-                duration = tForm[i]
-                note = pitch + duration
-                barString = barString + note + ' '
-            clef.append(barString)
-            if self.barPerLine != 0 and (k+1) % self.barPerLine == 0:
-                clef.append('\\break')
+        if clef is self.tBar:
+            clef[:] = self.iterText(self.plans()[0], self.seed)
+
+    def generate(self, seed=None, first=0, last=None):
+        ''' a new Sheet of the bars first..last-1 (all by default) from
+            seed, a fresh random one when None. Only the chunks holding
+            those bars are drawn, plus the one ahead with different notes,
+            so any bar range or exercise costs its own size. The generator
+            is left as it was, so one instance can make any number of
+            independent sheets, from several threads too (without stats).
+            With an index a whole sheet made before is made again from
+            another seed, DEDUP_TRIES times at most, the index only takes
+            whole sheets: ValueError for a bar range
+        '''
+        if self.index is not None and (first != 0 or last is not None and last < self.numBars):
+            raise ValueError("an index dedups whole sheets, not bars %d..%d" % (first + 1, last))
+        if self.index is None:
+            return self.drawSheet(seed, first, last)
+        return self.dedupSheet(lambda seed: self.sheetPrint(self.drawSheet(seed, first, last)), seed)
+
+    def dedupSheet(self, draw, seed):
+        ''' the sheet of draw(seed) --> (sheet, fingerprint), drawn again from
+            another seed while the index holds the fingerprint, DEDUP_TRIES
+            times at most. The fingerprint goes into the index
+        '''
+        sheet, fp = draw(seed)
+        for tries in range(0, SightGen.DEDUP_TRIES):
+            if fp not in self.index.seen([fp], 'sheets'):
+                break
+            if self.stats is not None:
+                self.stats.count('sheetRedraws')
+            sheet, fp = draw(None if seed is None else '%s:again:%d' % (seed, tries))
+        self.index.add([fp], 'sheets')
+        return sheet
+
+    @classmethod
+    def sheetPrint(cls, sheet):
+        ''' (sheet, fingerprint of a Sheet for the index) '''
+        return sheet, BarIndex.fingerprint(sheet.signature().encode() + b''.join(
+            [BarIndex.barKey(staff.pitches, staff.durations) for staff in sheet.staffs]))
+
+    def drawText(self, seed):
+        ''' (text of each staff as the lists iterText makes, fingerprint of
+            the sheet as sheetPrint makes it) of the sheet of seed
+        '''
+        texts, keys = [], [self.signature().encode()]
+        for plan in self.plans():
+            formBytes = [bytes(form) for form in plan.forms]
+            pitches, durations = [], []
+            def notes(chunks):
+                # the notes go by as they are drawn, for the fingerprint
+                for bars in chunks:
+                    pitches.append(b''.join([bytes(p) for _, p, _ in bars]))
+                    durations.append(b''.join([formBytes[f] for _, _, f in bars]))
+                    yield bars
+            texts.append(list(self.lineText(notes(self.iterChunks(plan, seed)))))
+            keys += pitches + [b'/'] + durations + [b';']
+        return texts, BarIndex.fingerprint(b''.join(keys))
+
+    def drawSheet(self, seed, first=0, last=None):
+        ''' the Sheet of bars first..last-1 of seed, see generate '''
+        last = self.numBars if last is None else min(last, self.numBars)
+        sheet = Sheet(self.format, self.time, self.unit, self.barPerLine)
+        chunks = (first // SightGen.CHUNK, -(-last // SightGen.CHUNK))
+        for plan in self.plans():
+            staff = Staff(plan.name)
+            forms = plan.forms
+            bar = chunks[0] * SightGen.CHUNK
+            for bars in self.iterChunks(plan, seed, *chunks):
+                # the part of the chunk in first..last
+                bars = bars[max(0, first - bar):last - bar]
+                bar += SightGen.CHUNK
+                staff.extend([pitch for _, pitches, _ in bars for pitch in pitches],
+                             [duration for _, _, form in bars for duration in forms[form]],
+                             [len(pitches) for _, pitches, _ in bars])
+            sheet.staffs.append(staff)
+        return sheet
+
+    def buildSheet(self):
+        ''' generate the whole sheet of self.seed into a compact Sheet, no
+            text is made
+        '''
+        return self.generate(self.seed)
 
     def genNotes(self):
+        self.sheet = self.buildSheet()
+        start = time.perf_counter()
+        strings = [' '.join(staff.iterBars(self.barPerLine)) for staff in self.sheet.staffs]
+        self.tNoteString = strings[0]
         if self.format != 'Beats':
-            self.genClef(self.tBar)
-            self.genClef(self.bBar)
-            self.tNoteString = ' '.join(self.tBar)
-            self.bNoteString = ' '.join(self.bBar)
-        if self.format == 'Beats':
-            self.genBeats(self.tBar)
-            self.tNoteString = ' '.join(self.tBar)
+            self.bNoteString = strings[1]
+        if self.stats is not None:
+            self.stats.lap('join', start)
+
+    def printSheet(self, template, values, out=None):
+        start = time.perf_counter()
+        sheet = template % values
+        if self.stats is not None:
+            self.stats.lap('format', start)
+            self.stats.count('bytes', len(sheet) + 1)
+        print(sheet, file=out)
 
-    def printGrand(self):
-        print( SightGen.FORMAT_GRAND % (self.time, self.tNoteString, self.bNoteString))
+    def printGrand(self, out=None):
+        self.printSheet(SightGen.FORMAT_GRAND, (self.signature(), self.tNoteString, self.bNoteString), out)
 
-    def print2Treble(self):
-        print( SightGen.FORMAT_2TREBLE % (self.time, self.tNoteString, self.bNoteString))
+    def print2Treble(self, out=None):
+        self.printSheet(SightGen.FORMAT_2TREBLE, (self.signature(), self.tNoteString, self.bNoteString), out)
 
-    def printBeats(self):
-        print( SightGen.FORMAT_BEATS % (self.time, self.tNoteString))
+    def printBeats(self, out=None):
+        self.printSheet(SightGen.FORMAT_BEATS, (self.signature(), self.tNoteString), out)
 
-    def genSheet(self):
+    def genSheet(self, out=None, sinks=None):
+        ''' generate the sheet and print it to out, stdout when None. With
+            sinks (see gensinks.py) the sheet is generated once and every
+            bar goes to each sink instead
+        '''
+        if sinks is not None:
+            self.feedSinks(sinks)
+            return
         self.genNotes()
         if self.format == '2Treble':
-            self.print2Treble()
+            self.print2Treble(out)
 
         if self.format == 'Grand':
-            self.printGrand()
+            self.printGrand(out)
 
         if self.format == 'Beats':
-            self.printBeats()
+            self.printBeats(out)
+
+    def feedSinks(self, sinks):
+        ''' one pass over the bars of all staffs in step, each bar goes to
+            every sink as the (TN indexes, DURATIONS codes, text) of each
+            staff
+        '''
+        plans = self.plans()
+        for sink in sinks:
+            sink.begin(self)
+        if self.index is not None:
+            # a sheet made before is only known once it is whole
+            staffs = self.generate(self.seed).staffs
+            for k in range(0, self.numBars):
+                bars = [tuple(map(tuple, staff.bar(k))) for staff in staffs]
+                bars = [(pitches, durations, SightGen.barText(pitches, durations)) for pitches, durations in bars]
+                for sink in sinks:
+                    sink.bar(k, bars)
+        else:
+            k = 0
+            staffChunks = [self.iterChunks(plan, self.seed) for plan in plans]
+            for chunks in zip(*staffChunks):
+                for bars in zip(*chunks):
+                    bars = [(pitches, plan.forms[form], text)
+                            for plan, (text, pitches, form) in zip(plans, bars)]
+                    for sink in sinks:
+                        sink.bar(k, bars)
+                    k += 1
+        for sink in sinks:
+            sink.end()
+
+    def iterStaffs(self):
+        ''' the values for the %s of the format template in order: the time,
+            then one bar generator per staff
+        '''
+        if self.index is not None:
+            # a sheet made before is only known once it is whole, its text
+            # is held until then
+            return [self.signature()] + [iter(text) for text in self.dedupSheet(self.drawText, self.seed)]
+        return [self.signature()] + [self.iterText(plan, self.seed) for plan in self.plans()]
+
+    def splitSheet(self, path, size):
+        ''' write the sheet as self-contained .ly files of size bars each,
+            rounded up to whole lines of barPerLine bars: path 'big.ly' gives
+            big-001.ly, big-002.ly, ... Each part is generated on its own, so
+            the memory of a part and of lilypond on it stays the same for
+            any numBars, and the parts can be rendered in parallel. Returns
+            the paths of the parts. With stats every part counts, the chunks
+            a part shares with the next one are drawn by both
+        '''
+        if self.barPerLine != 0:
+            size = -(-size // self.barPerLine) * self.barPerLine
+        # the parts of an unseeded sheet share a seed so they go on from each other
+        seed = random.randrange(1<<32) if self.seed is None else self.seed
+        base, ext = os.path.splitext(path)
+        width = max(3, len(str(-(-self.numBars // size))))
+        paths = []
+        for k, first in enumerate(range(0, self.numBars, size), 1):
+            paths.append('%s-%0*d%s' % (base, width, k, ext or '.ly'))
+            with open(paths[-1], 'w', buffering=1<<16) as out:
+                sheet = self.generate(seed, first, first + size)
+                if self.stats is not None:
+                    start = time.perf_counter()
+                    out = CountingWriter(out, self.stats)
+                writeLilypond(sheet, out)
+                if self.stats is not None:
+                    self.stats.lap('write', start)
+                    self.stats.count('parts')
+        return paths
+
+    def streamSheet(self, out):
+        ''' write the sheet to the file object out bar by bar. The template
+            goes out as header, staff bars and footer pieces, no bar list or
+            note string is kept so the memory stays flat for any numBars
+        '''
+        self.writeTemplate(out, SightGen.FORMAT_TEMPLATE[self.format])
+        out.write('\n')
+        if self.stats is not None:
+            self.stats.count('bytes')
+
+    def writeTemplate(self, out, template):
+        ''' write template with its %s filled by iterStaffs() '''
+        stats = self.stats
+        if stats is not None:
+            # write is what is left once the generators took their share
+            start = time.perf_counter()
+            spent = sum(stats.seconds.get(phase, 0.0) for phase in ('rng', 'build'))
+            out = CountingWriter(out, stats)
+        SightGen.writeValues(out, template, self.iterStaffs())
+        if stats is not None:
+            spent = sum(stats.seconds.get(phase, 0.0) for phase in ('rng', 'build')) - spent
+            stats.lap('write', start + spent)
+
+    @classmethod
+    def writeValues(cls, out, template, values):
+        ''' write template with each %s filled by the next of values: a
+            string, or an iterable of bars joined by single spaces
+        '''
+        pieces = template.split('%s')
+        out.write(pieces[0])
+        for value, piece in zip(values, pieces[1:]):
+            if isinstance(value, str):
+                out.write(value)
+            else:
+                # same spacing as ' '.join(clef)
+                sep = ''
+                for bar in value:
+                    out.write(sep)
+                    out.write(bar)
+                    sep = ' '
+            out.write(piece)
+
+    @classmethod
+    def formCodes(cls, tFormList):
+        ''' the forms of an R4Dict entry as tuples of DURATIONS codes '''
+        return [tuple(SightGen.DURATIONS.index(duration) for duration in tForm)
+                for tForm in tFormList]
+
+    @classmethod
+    def barText(cls, pitches, durations):
+        ''' LilyPond text of one bar of TN indexes and DURATIONS codes '''
+        noteText = SightGen.NOTE_TEXT
+        return ''.join([noteText[pitch][duration] for pitch, duration in zip(pitches, durations)])
+
+    @classmethod
+    def lilyBars(cls, pitches, durations, lengths, firstBar, barPerLine):
+        ''' LilyPond text of consecutive bars, lengths holds the notes per
+            bar and firstBar the number of the first one, a '\\break' follows
+            every barPerLine bars
+        '''
+        # every note is looked up once in NOTE_TEXT, then sliced into bars
+        noteText = SightGen.NOTE_TEXT
+        notes = [noteText[pitch][duration] for pitch, duration in zip(pitches, durations)]
+        bars = []
+        end = 0
+        for k, length in enumerate(lengths, firstBar):
+            begin, end = end, end + length
+            bars.append(''.join(notes[begin:end]))
+            if barPerLine != 0 and (k+1) % barPerLine == 0:
+                bars.append('\\break')
+        return bars
+
+    def exercise(self, index):
+        ''' the generator of exercise index (from 0) of a series: same
+            options, the seed is derived from the seed and the index
+        '''
+        gen = copy.copy(self)
+        gen.tBar, gen.bBar = [], []
+        if self.seed is not None:
+            gen.seed = '%s:%d' % (self.seed, index)
+        return gen
+
+    def streamBook(self, out, count, title='Exercise %d', shard=None):
+        ''' write count exercises as the scores of a single \book, so one
+            lilypond run engraves all of them. Every score gets a header
+            with its title, title % number for exercise number 1..count.
+            shard (k, N) writes the k-th of N slices only (see shardRange),
+            the first one with the book header and the last one with its
+            footer, so the N outputs put together are the whole book
+        '''
+        k, n = (1, 1) if shard is None else shard
+        first, last = SightGen.shardRange(count, k, n)
+        if k == 1:
+            out.write(SightGen.FORMAT_BOOK_HEADER)
+        for i in range(first, last):
+            template = SightGen.bookScore(self.format, title % (i+1))
+            gen = self.exercise(i)
+            gen.stats = self.stats
+            gen.writeTemplate(out, template)
+        if k == n:
+            out.write(SightGen.FORMAT_BOOK_FOOTER)
+
+    @classmethod
+    def bookScore(cls, format, title):
+        ''' template of one score of a \book in format, headed by title '''
+        header = SightGen.FORMAT_SCORE_TITLE % title.replace('"', '\\"')
+        return SightGen.FORMAT_BOOK_SCORE + SightGen.SCORE_TEMPLATE[format] % (header + SightGen.FORMAT_FOOTER)
+
+    @classmethod
+    def shardRange(cls, count, k, n):
+        ''' (first, last) exercises of shard k (from 1) of n of count
+            exercises, the shards differ by one exercise at most
+        '''
+        return count * (k-1) // n, count * k // n
 
     @classmethod
     def noteNum(cls, n):
@@ -280,26 +1147,132 @@ class SightGen:
             raise argparse.ArgumentTypeError("The number of notes should be integer and can be devided by 4")
         return n
 
-if __name__ == "__main__":
+    @classmethod
+    def timeSignature(cls, text):
+        ''' (beats, unit) of a -t value: '3' for 3/4, or '6/8' '''
+        beats, _, unit = text.partition('/')
+        try:
+            beats, unit = int(beats), int(unit or 4)
+        except ValueError:
+            raise argparse.ArgumentTypeError("time is BEATS or BEATS/UNIT, got %r" % (text,))
+        if beats <= 0 or unit not in (1, 2, 4, 8, 16):
+            raise argparse.ArgumentTypeError("unsupported time signature %s/%s" % (beats, unit))
+        return beats, unit
+
+    @classmethod
+    def shard(cls, text):
+        ''' (k, N) of a --shard value 'k/N', 1 <= k <= N '''
+        k, _, n = text.partition('/')
+        try:
+            k, n = int(k), int(n)
+        except ValueError:
+            raise argparse.ArgumentTypeError("shard is K/N, got %r" % (text,))
+        if not 1 <= k <= n:
+            raise argparse.ArgumentTypeError("shard K/N needs 1 <= K <= N, got %s" % (text,))
+        return k, n
+
+    @classmethod
+    def durationSpec(cls, text):
+        ''' a -d value, 'duration' or 'duration:weight' with a finite weight
+            >= 0
+        '''
+        duration, sep, weight = text.partition(':')
+        if duration not in SightGen.DURATIONS:
+            raise argparse.ArgumentTypeError("unknown duration %r, durations are %s"
+                                             % (duration, ' '.join(SightGen.DURATIONS)))
+        try:
+            if sep and not (math.isfinite(float(weight)) and float(weight) >= 0):
+                raise ValueError
+        except ValueError:
+            raise argparse.ArgumentTypeError("a weight is a finite number >= 0, got %r" % (text,))
+        return text
+
+    @classmethod
+    def parseDurations(cls, specs):
+        ''' (durations, weights) of 'duration' or 'duration:weight' specs,
+            weights maps each duration to its weight, None when no spec has
+            one
+        '''
+        durations, weights = [], {}
+        for spec in specs:
+            duration, sep, weight = spec.partition(':')
+            if duration not in SightGen.DURATIONS:
+                raise ValueError("unknown duration %r, durations are %s" % (duration, ' '.join(SightGen.DURATIONS)))
+            durations.append(duration)
+            weights[duration] = float(weight) if sep else 1.0
+        if all(':' not in spec for spec in specs):
+            weights = None
+        return durations, weights
+
+    @classmethod
+    def argParser(cls):
+        ''' the command line parser of gen8.py, shared by the tools that take
+            gen8.py options '''
+        parser = argparse.ArgumentParser(description="Generate Random Notes In Lilypond",
+                formatter_class=argparse.RawTextHelpFormatter
+                       )
+
+        parser.add_argument('-f', '--format', choices=SightGen.FORMAT, default='Grand')
+        parser.add_argument('-n', '--number', type=int, default=16, help="in number of bars")
+        parser.add_argument('-T', '--Treble', nargs=2, type=int, default=(7,11), help='treble clef notes range, defaulti (7,11)')
+        parser.add_argument('-B', '--Bass', nargs=2, type=int, default=(0,4), help='bass clef notes range, default (0,4)')
+        parser.add_argument('-b', '--bar', type=int, default=0, help="number of bar perline")
+        parser.add_argument('-t', '--time', type=SightGen.timeSignature, default=(4,4),
+                help='time signature, BEATS (of quarters) or BEATS/UNIT like 6/8')
+        parser.add_argument('-l', '--level', nargs=2, type=int, default=[1,1], help='difficult level for treble and bass clif')
+        parser.add_argument('-d', '--durations', nargs='+', type=SightGen.durationSpec, default=None,
+                metavar='DURATION[:WEIGHT]',
+                help='make the forms of every bar out of these durations instead of\n'
+                     'the level ones, like 4 8 r8 or 4:3 8:1 (a form weighs the product)')
+        parser.add_argument('-p', '--profile', choices=range(1, len(SightGen.PROFILE)+1), type=int, default=None,
+                help='pick profile by number')
+        parser.add_argument('-P', '--Profile', choices=SightGen.PROFILE.keys(), default=None,
+                help='pick pofile by name')
+        parser.add_argument('-u', '--unique', action='store_true', default=False, help='make adjecent notes different')
+        parser.add_argument('-s', '--stream', action='store_true', default=False,
+                help='write the sheet bar by bar, memory stays flat for any number of bars.\n'
+                     'With --dedup the text of the sheet is held until it is whole')
+        parser.add_argument('-o', '--output', default=None, help='output file, default stdout')
+        parser.add_argument('--seed', type=int, default=None,
+                help='random seed, the same seed and options give the same sheet')
+        parser.add_argument('--book', type=int, default=None, metavar='COUNT',
+                help='write COUNT exercises as the scores of one \\book')
+        parser.add_argument('--shard', type=SightGen.shard, default=None, metavar='K/N',
+                help='write only the K-th (from 1) of N slices of the --book\n'
+                     'exercises and a manifest OUTPUT.shard.json, genshard.py puts\n'
+                     'the N outputs together into the whole book')
+        parser.add_argument('--exercise', type=int, default=None, metavar='I',
+                help='write exercise I (from 1) of the --book series of the seed alone')
+        parser.add_argument('--bars', nargs=2, type=int, default=None, metavar=('FIRST', 'LAST'),
+                help='write bars FIRST..LAST (from 1) of the sheet only, drawing\n'
+                     'just the chunks that hold them')
+        parser.add_argument('--split', type=int, default=None, metavar='BARS',
+                help='write the sheet as -o OUTPUT-001.ly, OUTPUT-002.ly, ... of BARS\n'
+                     'bars each (whole lines), to render in parallel')
+        parser.add_argument('--dedup', default=None, metavar='INDEX',
+                help='never repeat a sequence of --dedup-window bars of a staff, or a\n'
+                     'sheet, kept in the SQLite file INDEX: those are drawn again.\n'
+                     'Whole sheets only, not with --split or --bars. INDEX is read\n'
+                     'into memory, about 70 bytes a bar of a staff')
+        parser.add_argument('--dedup-window', type=int, default=4, metavar='BARS',
+                help='bars of a sequence, fixed when INDEX is made, default 4')
+        parser.add_argument('--table-limit', type=int, default=SightGen.TABLE_LIMIT, metavar='BARS',
+                help='enumerate the bar texts of a staff when it has at most BARS\n'
+                     'different bars, 0 builds every bar note by note')
+        parser.add_argument('--stats', nargs='?', const='-', default=None, metavar='FILE',
+                help='write per phase times and counters as json to FILE, default stderr')
+        parser.add_argument('--midi', default=None, metavar='FILE',
+                help='also write the sheet as a MIDI file, in the same pass')
+        parser.add_argument('--xml', default=None, metavar='FILE', help='also write the sheet as MusicXML')
+        parser.add_argument('--key', default=None, metavar='FILE', help='also write an answer key of note names')
+        parser.add_argument('--json', default=None, metavar='FILE', help='also write the notes as json')
+        parser.add_argument('--svg', default=None, metavar='FILE',
+                help='also draw a quick svg preview, no lilypond needed')
+        parser.add_argument('--cache-dir', default=None,
+                help='serve seeded sheets from this cache directory, store new ones there')
+        parser.add_argument('--cache-size', type=int, default=256, help='cache size in MB, default 256')
 
-    parser = argparse.ArgumentParser(description="Generate Random Notes In Lilypond",
-            formatter_class=argparse.RawTextHelpFormatter
-                   )
-
-    parser.add_argument('-f', '--format', choices=SightGen.FORMAT, default='Grand')
-    parser.add_argument('-n', '--number', type=int, default=16, help="in number of bars")
-    parser.add_argument('-T', '--Treble', nargs=2, type=int, default=(7,11), help='treble clef notes range, defaulti (7,11)')
-    parser.add_argument('-B', '--Bass', nargs=2, type=int, default=(0,4), help='bass clef notes range, default (0,4)')
-    parser.add_argument('-b', '--bar', type=int, default=0, help="number of bar perline")
-    parser.add_argument('-t', '--time', type=int, choices=[3,4], default=4, help='beats per bar')
-    parser.add_argument('-l', '--level', nargs=2, type=int, default=[1,1], help='difficult level for treble and bass clif')
-    parser.add_argument('-p', '--profile', choices=range(1, len(SightGen.PROFILE)+1), type=int, default=None,
-            help='pick profile by number')
-    parser.add_argument('-P', '--Profile', choices=SightGen.PROFILE.keys(), default=None,
-            help='pick pofile by name')
-    parser.add_argument('-u', '--unique', action='store_true', default=False, help='make adjecent notes different')
-
-    parser.epilog='''
+        parser.epilog='''
     Generate Random Notes In Lilypond
                    The position of each notes are index in the list with follwoing reference
                    0  --> Lowest C (2 lines below Bass Clef) --> C2
@@ -312,9 +1285,173 @@ if __name__ == "__main__":
     ./gen7.py -p 1
     ./gen7.py -P 1To5
     ./gen8.py -f Beats -l 5 5 -n 128
-                   '''
+    ./gen8.py -t 6/8 -d 4. 4 8 r8 -n 32
+                       '''
+        return parser
+
+    # argParser options gen8.py acts on itself, tools sharing the parser
+    # turn them down with rejectOptions
+    MAIN_OPTIONS = ('exercise', 'bars', 'shard', 'split', 'dedup', 'dedup_window', 'stats',
+                    'midi', 'xml', 'key', 'json', 'svg', 'cache_dir', 'cache_size')
+
+    @classmethod
+    def rejectOptions(cls, parser, args, names=MAIN_OPTIONS):
+        ''' parser.error for the first of the options names set in args '''
+        for name in names:
+            if getattr(args, name) != parser.get_default(name):
+                parser.error("--%s is a gen8.py option, %s does not take it"
+                             % (name.replace('_', '-'), parser.prog))
+
+    @classmethod
+    def fromArgs(cls, args, parser=None):
+        ''' SightGen from the options parsed by argParser. With parser the
+            staffs are planned at once and options they cannot be drawn
+            with (a level, weights or range) are a parser.error
+        '''
+        gen = cls(format=args.format, tRange=args.Treble, bRange=args.Bass,  notes=args.number,
+                barPerLine=args.bar, time=args.time[0], level=args.level, Profile=args.Profile,
+                        profile=args.profile, differentNote=args.unique, seed=args.seed,
+                        unit=args.time[1], durations=args.durations)
+        if parser is not None:
+            top = len(SightGen.TN) - 1
+            if not all(0 <= note <= top for note in list(gen.tRange) + list(gen.bRange)):
+                parser.error("-T/-B notes are TN indexes 0..%d" % top)
+            try:
+                gen.plans()
+            except ValueError as e:
+                parser.error(str(e))
+        return gen
+
+# text of every TN pitch with every duration, note text is a table lookup
+SightGen.NOTE_TEXT = [[(pitch if k < SightGen.REST else '') + duration + ' '
+                       for k, duration in enumerate(SightGen.DURATIONS)]
+                      for pitch in SightGen.TN]
+
+def generateSheet(seed=None, **options):
+    ''' a Sheet made with the SightGen options, fresh when seed is None '''
+    return SightGen(**options).generate(seed)
+
+def writeLilypond(sheet, out):
+    ''' write sheet as the LilyPond file of its format to the text file
+        object out (a file, a StringIO, a socket makefile('w')), bar by bar
+    '''
+    values = [sheet.signature()] + [staff.iterBars(sheet.barPerLine) for staff in sheet.staffs]
+    SightGen.writeValues(out, SightGen.FORMAT_TEMPLATE[sheet.format], values)
+    out.write('\n')
+
+def writeManifest(path, gen, count, shard):
+    ''' write the manifest of the shard (k, N) of count exercises in path
+        to path.shard.json: the key of the whole book, the shard, its
+        exercises and the size and sha1 of path
+    '''
+    digest, size = hashlib.sha1(), 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1<<16), b''):
+            digest.update(block)
+            size += len(block)
+    manifest = {'book':gen.configKey('book', count), 'count':count, 'shard':shard[0], 'shards':shard[1],
+                'exercises':list(SightGen.shardRange(count, *shard)),
+                'output':os.path.basename(path), 'bytes':size, 'sha1':digest.hexdigest()}
+    with open(path + '.shard.json', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+if __name__ == "__main__":
+
+    parser = SightGen.argParser()
     args = parser.parse_args()
-    gen = SightGen(format=args.format, tRange=args.Treble, bRange=args.Bass,  notes=args.number,
-            barPerLine=args.bar, time=args.time, level=args.level, Profile=args.Profile,
-                    profile=args.profile, differentNote=args.unique)
-    gen.genSheet()
+    SightGen.TABLE_LIMIT = args.table_limit
+    gen = SightGen.fromArgs(args, parser)
+    sinkFiles = [args.midi, args.xml, args.key, args.json, args.svg]
+    # every usage error comes before -o OUTPUT is opened, so none truncates it
+    if args.book is not None and args.book < 1:
+        parser.error("--book COUNT needs 1 exercise at least")
+    if args.exercise is not None and (args.exercise < 1 or args.book is not None):
+        parser.error("--exercise I writes exercise I (from 1) of a series alone, no --book")
+    if args.dedup is not None:
+        if args.dedup_window < 1:
+            parser.error("--dedup-window needs 1 bar at least")
+        if args.split is not None or args.bars is not None:
+            # the bars ahead of a part would not be in the index the way a whole run puts them
+            parser.error("--dedup indexes whole sheets, not --split parts or --bars")
+    if args.split is not None:
+        if args.output is None or args.split <= 0:
+            parser.error("--split BARS needs BARS > 0 and -o OUTPUT to name the parts")
+        if args.book is not None or args.bars is not None or any(sinkFiles):
+            parser.error("--split writes the LilyPond of one sheet only")
+        if args.cache_dir is not None:
+            parser.error("--split writes its parts anew, no --cache-dir")
+    if args.shard is not None and (args.book is None or args.output is None):
+        parser.error("--shard K/N slices a --book into -o OUTPUT, both are needed")
+    if args.bars is not None:
+        first, last = args.bars
+        if not 1 <= first <= last <= gen.numBars:
+            parser.error("--bars needs 1 <= FIRST <= LAST <= %d" % gen.numBars)
+        if args.book is not None or any(sinkFiles):
+            parser.error("--bars writes the LilyPond of one sheet only")
+    if args.book is not None and any(sinkFiles):
+        parser.error("--book writes LilyPond only, drop --midi/--xml/--key/--json/--svg")
+
+    if args.exercise is not None:
+        gen = gen.exercise(args.exercise - 1)
+    if args.stats is not None:
+        gen.stats = SheetStats()
+    if args.dedup is not None:
+        try:
+            gen.index = BarIndex(args.dedup, args.dedup_window)
+        except ValueError as e:
+            parser.error(str(e))
+    # with --split OUTPUT names the parts, the part paths go to stdout
+    out = sys.stdout if args.output is None or args.split is not None else open(args.output, 'w', buffering=1<<16)
+    if args.book is not None:
+        write = lambda f: gen.streamBook(f, args.book, shard=args.shard)
+        key = gen.configKey('book', args.book, *(args.shard or ()))
+    else:
+        write, key = gen.streamSheet, gen.configKey()
+    if args.split is not None:
+        for path in gen.splitSheet(args.output, args.split):
+            print(path, file=out)
+    elif args.bars is not None:
+        writeLilypond(gen.generate(gen.seed, first - 1, last), out)
+    elif any(sinkFiles):
+        # the sinks import gen8 themselves
+        import gensinks
+        files = []
+        sinks = [gensinks.LilypondSink(out)]
+        for path, sink in zip(sinkFiles, [gensinks.MidiSink, gensinks.MusicXMLSink,
+                                          gensinks.AnswerKeySink, gensinks.JsonSink, gensinks.SvgSink]):
+            if path is not None:
+                files.append(open(path, 'wb' if sink is gensinks.MidiSink else 'w'))
+                sinks.append(sink(files[-1]))
+        gen.genSheet(sinks=sinks)
+        for f in files:
+            f.close()
+    elif args.cache_dir is not None and gen.seed is not None and gen.index is None:
+        cache = SheetCache(args.cache_dir, args.cache_size<<20)
+        path = cache.get(key)
+        if path is None:
+            with cache.open(key) as f:
+                write(f)
+            path = cache.commit(key, f.name)
+        elif gen.stats is not None:
+            gen.stats.count('cacheHits')
+        with open(path) as f:
+            shutil.copyfileobj(f, out)
+    elif args.stream or args.book is not None:
+        write(out)
+    else:
+        sys.stdout = out
+        gen.genSheet()
+    out.close()
+    if gen.index is not None:
+        gen.index.close()
+    if args.shard is not None:
+        writeManifest(args.output, gen, args.book, args.shard)
+
+    if gen.stats is not None:
+        report = json.dumps(gen.stats.report(), sort_keys=True)
+        if args.stats == '-':
+            print(report, file=sys.stderr)
+        else:
+            with open(args.stats, 'w') as f:
+                f.write(report + '\n')
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+
+# the program is to run all the named gen8.py recipes of a manifest (train.txt) in one process
+import os
+import sys
+import json
+import shlex
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from gen8 import SightGen
+from sheetcache import SheetCache
+import genrender
+
+def readManifest(path):
+    ''' recipes of a manifest as a list of (name, gen8 argv, output file).
+        A recipe is a 'name: comment' line followed by its command line:
+            sr1: B: 3,4,5 T: 1,2,3 / unique
+            ./gen8.py -f 2Treble -B 16 18 -T 21 23 -n 128 -b 4 -u > sr1.ly
+    '''
+    recipes, name = [], None
+    for line in open(path):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        if not line.split()[0].endswith('.py'):
+            name = line.split(':')[0].strip()
+            continue
+
+        words = shlex.split(line)
+        argv, output = [], None
+        i = 1
+        while i < len(words):
+            if words[i] == '>':
+                output = words[i+1]
+                i += 2
+                continue
+            if words[i].startswith('>'):
+                output = words[i][1:]
+            else:
+                argv.append(words[i])
+            i += 1
+        if name is None:
+            name = os.path.splitext(os.path.basename(output))[0]
+        recipes.append((name, argv, output))
+        name = None
+    return recipes
+
+# the gen8.py options of its own main block a recipe may not use, --book
+# and --exercise are run here
+RECIPE_REJECTS = tuple(name for name in SightGen.MAIN_OPTIONS if name != 'exercise') + ('table_limit',)
+
+def buildGen(argv, seed=None):
+    ''' (SightGen, book count or None) of a recipe command line, seed is
+        used when it has none. ValueError for the options a recipe cannot
+        take
+    '''
+    parser = SightGen.argParser()
+    args = parser.parse_args(argv)
+    if args.seed is None:
+        args.seed = seed
+    if args.output is not None:
+        raise ValueError("recipe writes to -o %s, use '> file' instead" % args.output)
+    for name in RECIPE_REJECTS:
+        if getattr(args, name) != parser.get_default(name):
+            raise ValueError("--%s is not run in a recipe, call gen8.py for it" % name.replace('_', '-'))
+    if args.book is not None and args.book < 1:
+        raise ValueError("--book COUNT needs 1 exercise at least")
+    gen = SightGen.fromArgs(args)
+    if args.exercise is not None:
+        if args.exercise < 1 or args.book is not None:
+            raise ValueError("--exercise I writes exercise I (from 1) of a series alone, no --book")
+        gen = gen.exercise(args.exercise - 1)
+    return gen, args.book
+
+def recipeKey(gen, book):
+    ''' configKey of what a recipe writes, a sheet or a book '''
+    return gen.configKey() if book is None else gen.configKey('book', book)
+
+def runRecipe(name, argv, output, seed=None, cacheDir=None, cacheBytes=256<<20):
+    ''' generate one recipe into output, returns (name, output, key of
+        recipeKey), seeded recipes are served from and stored into the
+        cache if given
+    '''
+    gen, book = buildGen(argv, seed)
+    key = recipeKey(gen, book)
+    write = gen.streamSheet if book is None else (lambda f: gen.streamBook(f, book))
+    # write next to the target and rename, a killed run never leaves half a sheet
+    part = output + '.part'
+    if cacheDir is not None and gen.seed is not None:
+        cache = SheetCache(cacheDir, cacheBytes)
+        path = cache.get(key)
+        if path is None:
+            with cache.open(key) as f:
+                write(f)
+            path = cache.commit(key, f.name)
+        shutil.copyfile(path, part)
+    else:
+        with open(part, 'w', buffering=1<<16) as out:
+            write(out)
+    os.replace(part, output)
+    return name, output, key
+
+def restoreRenders(cache, key, output):
+    ''' copy the cached rendered files of key next to output, False if
+        there are none
+    '''
+    base = os.path.splitext(output)[0]
+    # entries stored before renders were matched exactly may hold another
+    # sheet's file (render0.pdf of sr10 under sr1), those are skipped
+    names = [n for n in cache.names(key) if n.startswith('render') and isRenderSuffix(n[len('render'):])]
+    for n in names:
+        shutil.copyfile(cache.get(key, n), base + n[len('render'):])
+    return len(names) > 0
+
+def storeRenders(cache, key, job):
+    ''' cache the files of a finished RenderJob as render<suffix>, suffix
+        the '.pdf' or '-1.png' after the output base of the job
+    '''
+    for path in job.outputs:
+        suffix = path[len(job.out):]
+        if not path.startswith(job.out) or not isRenderSuffix(suffix):
+            print("%s: %s is not a render of it, not cached" % (job.ly, path), file=sys.stderr)
+            continue
+        cache.put(key, 'render' + suffix, path)
+
+def isRenderSuffix(suffix):
+    ''' True for what follows the output base in a rendered file: '.pdf',
+        or a page like '-2.png'
+    '''
+    page, dot, ext = suffix.partition('.')
+    return dot == '.' and ext != '' and (page == '' or (page[0] == '-' and page[1:].isdigit()))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run gen8.py recipes of a manifest in one process")
+    parser.add_argument('manifest', help='recipe list in the train.txt format')
+    parser.add_argument('names', nargs='*', help='recipes to run, default all')
+    parser.add_argument('-d', '--directory', default='.', help='directory of the output files')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes, default cpu count')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the recipes without --seed')
+    parser.add_argument('-F', '--force', action='store_true', default=False,
+            help='regenerate up to date outputs too')
+    parser.add_argument('-r', '--render', action='store_true', default=False,
+            help='render the written outputs afterwards')
+    parser.add_argument('--renderer', default=genrender.RENDERER, help='renderer command, see genrender.py')
+    parser.add_argument('--cache-dir', default=None,
+            help='serve seeded sheets and their renders from this cache directory')
+    parser.add_argument('--cache-size', type=int, default=256, help='cache size in MB, default 256')
+    args = parser.parse_args()
+
+    # outputs of the last runs: {output: configKey}, an output is up to date
+    # when it exists and was written from the same seeded configuration
+    statePath = os.path.join(args.directory, '.genbatch.json')
+    state = json.load(open(statePath)) if os.path.exists(statePath) else {}
+
+    jobs, seeded, failed = [], set(), 0
+    for name, argv, output in readManifest(args.manifest):
+        if args.names and name not in args.names:
+            continue
+        output = os.path.join(args.directory, output)
+        try:
+            gen, book = buildGen(argv, args.seed)
+        except ValueError as e:
+            print("%s: failed, %s" % (name, e), file=sys.stderr)
+            failed += 1
+            continue
+        if not args.force and gen.seed is not None and os.path.exists(output) \
+                and state.get(output) == recipeKey(gen, book):
+            print("%s: %s is up to date" % (name, output))
+            continue
+        jobs.append((name, argv, output))
+        if gen.seed is not None:
+            seeded.add(output)
+
+    written = []
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = [(name, pool.submit(runRecipe, name, argv, output, args.seed,
+                                      args.cache_dir, args.cache_size<<20))
+                   for name, argv, output in jobs]
+        for name, future in futures:
+            try:
+                name, output, key = future.result()
+            except Exception as e:
+                print("%s: failed, %s" % (name, e), file=sys.stderr)
+                failed += 1
+                continue
+            state[output] = key
+            written.append(output)
+            print("%s: wrote %s" % (name, output))
+
+    with open(statePath, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+    if args.render and written:
+        # seeded outputs rendered before come from the cache
+        cache = None if args.cache_dir is None else SheetCache(args.cache_dir, args.cache_size<<20)
+        if cache is not None:
+            written = [output for output in written
+                       if not (output in seeded and restoreRenders(cache, state[output], output))]
+        renders = genrender.renderAll(written, args.renderer, args.jobs)
+        genrender.printReport(renders)
+        failed += len([job for job in renders if not job.ok])
+        if cache is not None:
+            for job in renders:
+                if job.ok and job.ly in seeded:
+                    storeRenders(cache, state[job.ly], job)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+
+# the program is to keep generated exercises in a compact binary corpus and render any of them to LilyPond on demand
+import sys
+import json
+import mmap
+import struct
+import argparse
+from array import array
+
+from gen8 import SightGen, Sheet, Staff, writeLilypond
+
+# file layout, little endian:
+#   MAGIC, uint32 length of the metadata, the metadata as json, zero padding
+#   to 8 bytes
+#   uint64 file offset of each exercise and of the end, count+1 of them
+#   the exercises, each staff as uint32 bars, uint32 notes, uint16 notes of
+#   every bar, uint8 TN index of every note, uint8 DURATIONS code of every
+#   note
+MAGIC = b'SGCORP\r\n'
+CORPUS_VERSION = 1
+HEAD = struct.Struct('<I')
+OFFSET = struct.Struct('<Q')
+STAFF = struct.Struct('<II')
+
+def packArray(values):
+    ''' bytes of an array, little endian '''
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def unpackArray(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def packSheet(sheet):
+    ''' the record of a Sheet '''
+    parts = []
+    for staff in sheet.staffs:
+        bars = staff.bars
+        lengths = array('H', [bars[k+1] - bars[k] for k in range(0, staff.numBars())])
+        parts += [STAFF.pack(staff.numBars(), len(staff.pitches)), packArray(lengths),
+                  staff.pitches.tobytes(), staff.durations.tobytes()]
+    return b''.join(parts)
+
+def writeCorpus(gen, out, count=None):
+    ''' write exercises 1..count of the series of gen (see
+        SightGen.exercise) to the seekable binary file object out, the
+        sheet of gen alone when count is None. The offsets go in once the
+        exercises are written, one exercise at a time is held in memory
+    '''
+    sheets = [gen] if count is None else map(gen.exercise, range(0, count))
+    count = 1 if count is None else count
+    plans = gen.plans()
+    meta = {'corpus':CORPUS_VERSION, 'count':count, 'format':gen.format, 'time':gen.time, 'unit':gen.unit,
+            'barPerLine':gen.barPerLine, 'staffs':[plan.name for plan in plans], 'config':gen.config()}
+    meta = json.dumps(meta, sort_keys=True).encode()
+    head = MAGIC + HEAD.pack(len(meta)) + meta
+    head += b'\0' * (-len(head) % 8)
+    out.write(head)
+    out.write(b'\0' * OFFSET.size * (count + 1))
+    offsets = [len(head) + OFFSET.size * (count + 1)]
+    for exercise in sheets:
+        offsets.append(offsets[-1] + out.write(packSheet(exercise.buildSheet())))
+    out.seek(len(head))
+    out.write(b''.join([OFFSET.pack(offset) for offset in offsets]))
+
+def asFormat(sheet, format):
+    ''' sheet for the template of format: its first staffs, as many as the
+        template has. ValueError when it has fewer
+    '''
+    if format is None or format == sheet.format:
+        return sheet
+    staffs = len(SightGen.FORMAT_TEMPLATE[format].split('%s')) - 2
+    if len(sheet.staffs) < staffs:
+        raise ValueError("a %s sheet has %d staff, %s needs %d" % (sheet.format, len(sheet.staffs), format, staffs))
+    other = Sheet(format, sheet.time, sheet.unit, sheet.barPerLine)
+    other.staffs = sheet.staffs[:staffs]
+    return other
+
+class Corpus:
+    ''' a corpus file opened for reading. The file is memory mapped: only
+        the metadata is read up front, an exercise is two offset lookups
+        and a copy of its own bytes
+            meta --> metadata, the SightGen config() is meta['config']
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a corpus file" % path)
+        size, = HEAD.unpack_from(self.map, len(MAGIC))
+        start = len(MAGIC) + HEAD.size
+        self.meta = json.loads(self.map[start:start + size].decode())
+        if self.meta['corpus'] != CORPUS_VERSION:
+            raise ValueError("%s is corpus version %s, this reads %d" % (path, self.meta['corpus'], CORPUS_VERSION))
+        self.index = start + size + (-(start + size) % 8)
+
+    def __len__(self):
+        return self.meta['count']
+
+    def sheet(self, i):
+        ''' the Sheet of exercise i (from 0) '''
+        if not 0 <= i < len(self):
+            raise IndexError("exercise %d of %d" % (i, len(self)))
+        offset, = OFFSET.unpack_from(self.map, self.index + OFFSET.size * i)
+        meta = self.meta
+        sheet = Sheet(meta['format'], meta['time'], meta['unit'], meta['barPerLine'])
+        for name in meta['staffs']:
+            bars, notes = STAFF.unpack_from(self.map, offset)
+            offset += STAFF.size
+            lengths = unpackArray('H', self.map[offset:offset + 2 * bars])
+            offset += 2 * bars
+            staff = Staff(name)
+            staff.extend(unpackArray('B', self.map[offset:offset + notes]),
+                         unpackArray('B', self.map[offset + notes:offset + 2 * notes]), lengths)
+            offset += 2 * notes
+            sheet.staffs.append(staff)
+        return sheet
+
+    def render(self, i, out, format=None):
+        ''' write exercise i (from 0) as the LilyPond file of format, the
+            format of the corpus when None
+        '''
+        writeLilypond(asFormat(self.sheet(i), format), out)
+
+    def renderBook(self, out, first, last, format=None, title='Exercise %d'):
+        ''' write exercises first..last-1 as the scores of one \\book, the
+            same text as SightGen.streamBook for the whole corpus
+        '''
+        out.write(SightGen.FORMAT_BOOK_HEADER)
+        for i in range(first, last):
+            sheet = asFormat(self.sheet(i), format)
+            values = [sheet.signature()] + [staff.iterBars(sheet.barPerLine) for staff in sheet.staffs]
+            SightGen.writeValues(out, SightGen.bookScore(sheet.format, title % (i+1)), values)
+        out.write(SightGen.FORMAT_BOOK_FOOTER)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+if __name__ == "__main__":
+
+    if sys.argv[1:2] == ['render']:
+        parser = argparse.ArgumentParser(prog='gencorpus.py render',
+                description="Render exercises of a corpus file to LilyPond")
+        parser.add_argument('corpus', help='corpus file')
+        parser.add_argument('first', type=int, help='exercise, from 1')
+        parser.add_argument('last', type=int, nargs='?', default=None,
+                help='render FIRST..LAST as the scores of one \\book')
+        parser.add_argument('-f', '--format', choices=SightGen.FORMAT, default=None,
+                help='template to render with, default the format of the corpus')
+        parser.add_argument('-o', '--output', default=None, help='output file, default stdout')
+        args = parser.parse_args(sys.argv[2:])
+        corpus = Corpus(args.corpus)
+        last = args.first if args.last is None else args.last
+        if not 1 <= args.first <= last <= len(corpus):
+            parser.error("exercises are 1..%d" % len(corpus))
+        out = sys.stdout if args.output is None else open(args.output, 'w', buffering=1<<16)
+        try:
+            if args.last is None:
+                corpus.render(args.first - 1, out, args.format)
+            else:
+                corpus.renderBook(out, args.first - 1, last, args.format)
+        except ValueError as e:
+            parser.error(str(e))
+        out.close()
+        sys.exit(0)
+
+    if sys.argv[1:2] == ['info']:
+        corpus = Corpus(sys.argv[2])
+        print(json.dumps(corpus.meta, indent=1, sort_keys=True))
+        sys.exit(0)
+
+    parser = SightGen.argParser()
+    parser.description = ("Generate Random Notes Into A Binary Corpus\n"
+                          "    gencorpus.py render FILE FIRST [LAST] [-f FORMAT] [-o OUT]\n"
+                          "    gencorpus.py info FILE")
+    args = parser.parse_args()
+    SightGen.rejectOptions(parser, args)
+    if args.output is None:
+        parser.error("a corpus is binary, give it a file with -o")
+    if args.book is not None and args.book < 1:
+        parser.error("--book COUNT needs 1 exercise at least")
+    SightGen.TABLE_LIMIT = args.table_limit
+    gen = SightGen.fromArgs(args, parser)
+    with open(args.output, 'wb') as out:
+        writeCorpus(gen, out, args.book)
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+
+# the program is to write generated sheets as Standard MIDI Files without running lilypond
+import sys
+import struct
+
+from gen8 import SightGen
+from rhythm import durationLength
+
+# ticks per quarter note
+DIVISION = 480
+# MIDI note of TN index 0 (c, is C2), the scale steps of each TN octave
+LOWEST_C = 36
+STEPS = [0, 2, 4, 5, 7, 9, 11]
+# the rhythm staff plays a side stick on the General MIDI drum channel (10)
+DRUM_CHANNEL = 9
+DRUM_NOTE = 37
+# Acoustic Grand Piano
+PROGRAM = 0
+
+# ticks of every SightGen.DURATIONS code
+TICKS = [durationLength(d) * DIVISION // 4 for d in SightGen.DURATIONS]
+
+def midiNote(index):
+    ''' MIDI note number of a TN index '''
+    return LOWEST_C + 12 * (index // 7) + STEPS[index % 7]
+
+def varLen(n):
+    ''' n as a MIDI variable length quantity, 7 bits a byte '''
+    data = [n & 0x7f]
+    n >>= 7
+    while n:
+        data.append(0x80 | (n & 0x7f))
+        n >>= 7
+    return bytes(reversed(data))
+
+def metaEvent(kind, data):
+    ''' a meta event at delta 0 '''
+    return b'\x00\xff' + bytes([kind]) + varLen(len(data)) + data
+
+def chunk(kind, data):
+    return kind + struct.pack('>I', len(data)) + data
+
+def tempoTrack(sheet, tempo):
+    ''' the first track: tempo in quarters per minute and time signature '''
+    unitPower = sheet.unit.bit_length() - 1
+    return (metaEvent(0x51, struct.pack('>I', 60000000 // tempo)[1:]) +
+            metaEvent(0x58, bytes([sheet.time, unitPower, 24, 8])) +
+            b'\x00\xff\x2f\x00')
+
+def staffTrack(staff, channel, velocity):
+    ''' the notes of a staff on channel, rests only move the time on '''
+    drum = channel == DRUM_CHANNEL
+    data = bytearray(metaEvent(0x03, staff.name.encode()))
+    if not drum:
+        data += bytes([0x00, 0xc0 | channel, PROGRAM])
+    on, off = 0x90 | channel, 0x80 | channel
+    ticks = TICKS
+    # MIDI note of every pitch and the encoded length of every duration
+    notes = [DRUM_NOTE if drum else midiNote(p) for p in range(0, len(SightGen.TN))]
+    lengths = [varLen(t) for t in ticks]
+    rest = SightGen.REST
+    wait = 0
+    for pitch, duration in zip(staff.pitches, staff.durations):
+        if duration >= rest:
+            wait += ticks[duration]
+            continue
+        note = notes[pitch]
+        data += varLen(wait)
+        data += bytes([on, note, velocity])
+        data += lengths[duration]
+        data += bytes([off, note, 0])
+        wait = 0
+    # a trailing rest still takes its time
+    data += varLen(wait) + b'\xff\x2f\x00'
+    return bytes(data)
+
+def writeMidi(sheet, out, tempo=96, velocity=80):
+    ''' write sheet as a format 1 Standard MIDI File to the binary file
+        object out: a tempo track, then one track per staff, the rhythm
+        staff of Beats on the drum channel
+    '''
+    tracks = [tempoTrack(sheet, tempo)]
+    for k, staff in enumerate(sheet.staffs):
+        channel = DRUM_CHANNEL if staff.name == 'rhythm' else k
+        tracks.append(staffTrack(staff, channel, velocity))
+    out.write(chunk(b'MThd', struct.pack('>HHH', 1, len(tracks), DIVISION)))
+    for track in tracks:
+        out.write(chunk(b'MTrk', track))
+
+if __name__ == "__main__":
+
+    parser = SightGen.argParser()
+    parser.description = "Generate Random Notes As A MIDI File"
+    parser.add_argument('--tempo', type=int, default=96, help='quarter notes per minute, default 96')
+    parser.add_argument('--velocity', type=int, default=80, choices=range(1, 128), metavar='1..127',
+            help='note velocity, default 80')
+    args = parser.parse_args()
+    SightGen.rejectOptions(parser, args)
+    if args.book is not None:
+        parser.error("--book makes one LilyPond file, generate the exercises one by one for MIDI")
+
+    sheet = SightGen.fromArgs(args, parser).buildSheet()
+    out = sys.stdout.buffer if args.output is None else open(args.output, 'wb')
+    writeMidi(sheet, out, args.tempo, args.velocity)
+    out.flush()
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+# the program is to render generated .ly sheets with a bounded pool of lilypond processes
+import os
+import sys
+import re
+import json
+import time
+import shlex
+import asyncio
+import argparse
+
+# {ly} is the sheet, {out} the output path without extension, lilypond adds .pdf/.png
+RENDERER = 'lilypond --pdf -o {out} {ly}'
+# extensions of rendered files
+EXTENSIONS = ('pdf', 'png', 'svg', 'midi', 'mid')
+# file times come from a coarse kernel clock that can lag time.time() a little
+MTIME_SLACK = 0.05
+
+class RenderJob:
+    ''' one sheet to render and, once done, how it went
+            ly      --> the .ly file
+            out     --> output path without extension
+            outputs --> files the renderer produced (pdf, png, midi)
+            seconds --> wall time of the renderer
+            code    --> exit code, None when it could not be started
+            error   --> tail of stderr or the reason of the failure
+    '''
+    def __init__(self, ly, outDir=None):
+        self.ly = ly
+        base = os.path.splitext(os.path.basename(ly))[0]
+        self.out = os.path.join(outDir or os.path.dirname(ly) or '.', base)
+        self.outputs = []
+        self.seconds = 0.0
+        self.code = None
+        self.error = ''
+
+    @property
+    def ok(self):
+        return self.code == 0
+
+    def report(self):
+        return {'ly':self.ly, 'outputs':self.outputs, 'seconds':round(self.seconds, 3),
+                'code':self.code, 'error':self.error}
+
+async def renderJob(job, command, limit, timeout=None):
+    ''' run the renderer command of one job once limit has a free slot '''
+    argv = [word.format(ly=job.ly, out=job.out) for word in shlex.split(command)]
+    async with limit:
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            proc = await asyncio.create_subprocess_exec(*argv,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            job.error = str(e)
+            return job
+        try:
+            _, err = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            err = b''
+            job.error = 'timed out after %ss' % timeout
+        job.seconds = time.perf_counter() - start
+        job.code = proc.returncode
+    if job.code != 0 and not job.error:
+        job.error = err.decode(errors='replace').strip()[-500:]
+    job.outputs = jobOutputs(job.out, started)
+    return job
+
+def jobOutputs(out, since):
+    ''' files rendered to out since the time since: out.<ext> and the
+        pages out-<N>.<ext> lilypond writes, not older files or other
+        sheets that share the name as a prefix (sr1 and sr10)
+    '''
+    directory, base = os.path.split(out)
+    pattern = re.compile(re.escape(base) + r'(-\d+)?\.(%s)$' % '|'.join(EXTENSIONS))
+    outputs = []
+    for name in os.listdir(directory or '.'):
+        path = os.path.join(directory, name)
+        if pattern.match(name):
+            try:
+                if os.path.getmtime(path) >= since - MTIME_SLACK:
+                    outputs.append(path)
+            except FileNotFoundError:
+                pass
+    return sorted(outputs)
+
+async def renderAsync(jobs, command=RENDERER, jobCount=None, timeout=None):
+    limit = asyncio.Semaphore(jobCount or os.cpu_count() or 1)
+    return await asyncio.gather(*[renderJob(job, command, limit, timeout) for job in jobs])
+
+def renderAll(lyFiles, command=RENDERER, jobCount=None, outDir=None, timeout=None):
+    ''' render the .ly files with at most jobCount renderers at a time,
+        returns the finished RenderJob list in the order of lyFiles
+    '''
+    jobs = [RenderJob(ly, outDir) for ly in lyFiles]
+    if outDir is not None:
+        os.makedirs(outDir, exist_ok=True)
+    return asyncio.run(renderAsync(jobs, command, jobCount, timeout))
+
+def printReport(jobs, out=sys.stderr):
+    for job in jobs:
+        if job.ok:
+            print("%-30s %7.2fs %s" % (job.ly, job.seconds, ' '.join(job.outputs)), file=out)
+        else:
+            print("%-30s %7.2fs FAILED (%s) %s" % (job.ly, job.seconds, job.code, job.error), file=out)
+    failed = len([job for job in jobs if not job.ok])
+    print("%d rendered, %d failed, %.2fs renderer time" %
+          (len(jobs) - failed, failed, sum(job.seconds for job in jobs)), file=out)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Render .ly sheets in parallel",
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('files', nargs='+', help='.ly files to render')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='renderers at a time, default cpu count')
+    parser.add_argument('-r', '--renderer', default=RENDERER,
+            help='renderer command, {ly} is the sheet and {out} the output\n'
+                 'path without extension, default: %s' % RENDERER)
+    parser.add_argument('-d', '--directory', default=None, help='output directory, default next to the sheet')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds before a renderer is killed')
+    parser.add_argument('--json', default=None, help='write the per job report as json to this file')
+    args = parser.parse_args()
+
+    jobs = renderAll(args.files, args.renderer, args.jobs, args.directory, args.timeout)
+    printReport(jobs)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump([job.report() for job in jobs], f, indent=1)
+    sys.exit(0 if all(job.ok for job in jobs) else 1)
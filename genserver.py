@@ -0,0 +1,334 @@
+#!/usr/bin/python
+
+# the program is to serve gen8.py sheets over HTTP from one long running process
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import traceback
+from collections import OrderedDict, deque
+from contextlib import redirect_stderr
+
+from gen8 import SightGen, writeLilypond
+
+# the gen8.py options a request may set, the others belong to the server
+# (output, stats, cache, table limit) or to outputs it does not make
+REQUEST_OPTIONS = ('format', 'number', 'Treble', 'Bass', 'bar', 'time', 'level', 'durations',
+                   'profile', 'Profile', 'unique', 'stream', 'seed', 'book', 'exercise', 'bars')
+
+# built once, every request is parsed by it
+PARSER = SightGen.argParser()
+
+class BadRequest(Exception):
+    pass
+
+def argvOf(params):
+    ''' gen8.py command line of the json parameters of a request, either
+        {"argv": ["-f", "Grand", ...]} or the long option names as keys:
+            {"format": "Grand", "number": 32, "Treble": [21, 25], "unique": true}
+    '''
+    if not isinstance(params, dict):
+        raise BadRequest("parameters are a json object")
+    if 'argv' in params:
+        if not isinstance(params['argv'], list):
+            raise BadRequest("argv is a list of strings")
+        return [str(word) for word in params['argv']]
+    argv = []
+    for name, value in params.items():
+        option = '--' + name.replace('_', '-')
+        if value is False or value is None:
+            continue
+        if value is True:
+            argv.append(option)
+        elif isinstance(value, list):
+            argv.append(option)
+            argv.extend(str(v) for v in value)
+        else:
+            argv.extend([option, str(value)])
+    return argv
+
+def buildGen(params, maxBars=None, maxBook=None):
+    ''' SightGen and (for books) exercise count of the request parameters,
+        checked by the gen8.py parser. A sheet of more than maxBars bars or
+        a book of more than maxBook exercises is a BadRequest, None for no
+        limit
+    '''
+    argv = argvOf(params)
+    err = io.StringIO()
+    try:
+        with redirect_stderr(err):
+            args = PARSER.parse_args(argv)
+    except SystemExit:
+        # the last line is 'prog: error: why'
+        raise BadRequest(err.getvalue().strip().splitlines()[-1].partition('error: ')[2]
+                         if err.getvalue() else 'bad parameters')
+    for name, value in vars(args).items():
+        if name not in REQUEST_OPTIONS and value != PARSER.get_default(name):
+            raise BadRequest("--%s is not served, only %s" % (name.replace('_', '-'),
+                             ' '.join(['--' + option.replace('_', '-') for option in REQUEST_OPTIONS])))
+    if args.book is not None and args.book < 1:
+        raise BadRequest("--book COUNT needs 1 exercise at least")
+    if maxBook is not None and args.book is not None and args.book > maxBook:
+        raise BadRequest("--book COUNT is %d exercises at most here" % maxBook)
+    top = len(SightGen.TN) - 1
+    for name, noteRange in (('Treble', args.Treble), ('Bass', args.Bass)):
+        if not all(0 <= note <= top for note in noteRange):
+            raise BadRequest("--%s notes are TN indexes 0..%d" % (name, top))
+    gen = SightGen.fromArgs(args)
+    # a profile sets the bars too
+    if gen.numBars < 1:
+        raise BadRequest("--number needs 1 bar at least")
+    if maxBars is not None and gen.numBars > maxBars:
+        raise BadRequest("--number is %d bars at most here" % maxBars)
+    try:
+        gen.plans()
+    except ValueError as e:
+        # a level, weights or range no staff can be drawn with
+        raise BadRequest(str(e))
+    if args.exercise is not None:
+        if args.exercise < 1 or args.book is not None:
+            raise BadRequest("--exercise I writes exercise I (from 1) of a series alone, no --book")
+        gen = gen.exercise(args.exercise - 1)
+    if args.bars is not None:
+        first, last = args.bars
+        if not 1 <= first <= last <= gen.numBars:
+            raise BadRequest("--bars needs 1 <= FIRST <= LAST <= %d" % gen.numBars)
+        if args.book is not None:
+            raise BadRequest("--bars writes the LilyPond of one sheet only")
+    return gen, args.book, args.bars
+
+def requestKey(gen, book, bars):
+    ''' configKey of what a request gets, a sheet, a book or a bar range '''
+    if book is not None:
+        return gen.configKey('book', book)
+    if bars is not None:
+        return gen.configKey('bars', *bars)
+    return gen.configKey()
+
+def generate(gen, book, bars=None):
+    ''' the .ly text of a sheet, book or bars FIRST..LAST (from 1) as bytes '''
+    out = io.StringIO()
+    if bars is not None:
+        writeLilypond(gen.generate(gen.seed, bars[0] - 1, bars[1]), out)
+    elif book is None:
+        gen.streamSheet(out)
+    else:
+        gen.streamBook(out, book)
+    return out.getvalue().encode()
+
+class SheetLRU:
+    ''' the most recently used sheets, at most maxBytes of text, keyed by
+        SightGen.configKey() so only seeded sheets are kept
+    '''
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.sheets = OrderedDict()
+
+    def get(self, key):
+        sheet = self.sheets.get(key)
+        if sheet is not None:
+            self.sheets.move_to_end(key)
+        return sheet
+
+    def put(self, key, sheet):
+        if len(sheet) > self.maxBytes:
+            return
+        if key in self.sheets:
+            self.size -= len(self.sheets.pop(key))
+        self.sheets[key] = sheet
+        self.size += len(sheet)
+        while self.size > self.maxBytes:
+            _, old = self.sheets.popitem(last=False)
+            self.size -= len(old)
+
+class Metrics:
+    ''' request counters and the latency of the last window requests
+            requests, hits, misses, errors --> counts since the start
+            latencies --> seconds of the last window requests, for the
+                          percentiles
+    '''
+    def __init__(self, window=4096):
+        self.started = time.time()
+        self.counts = {'requests':0, 'hits':0, 'misses':0, 'shared':0, 'errors':0}
+        self.latencies = deque(maxlen=window)
+        self.total = 0.0
+
+    def record(self, seconds, outcome):
+        self.counts['requests'] += 1
+        self.counts[outcome] += 1
+        self.latencies.append(seconds)
+        self.total += seconds
+
+    def report(self, lru):
+        window = sorted(self.latencies)
+        def percentile(p):
+            return round(window[min(len(window) - 1, int(p * len(window)))] * 1000, 3) if window else None
+        return {'uptime':round(time.time() - self.started, 1), 'counts':self.counts,
+                'latencyMs':{'mean':round(self.total / self.counts['requests'] * 1000, 3)
+                                     if self.counts['requests'] else None,
+                             'p50':percentile(0.5), 'p90':percentile(0.9), 'p99':percentile(0.99),
+                             'max':round(window[-1] * 1000, 3) if window else None,
+                             'window':len(window)},
+                'cache':{'sheets':len(lru.sheets), 'bytes':lru.size, 'maxBytes':lru.maxBytes}}
+
+class SheetServer:
+    ''' HTTP/1.1 over TCP or a Unix socket:
+            POST /sheet    --> json parameters in, .ly text out
+            GET  /metrics  --> counters, latency percentiles, cache use
+            GET  /health   --> 'ok'
+        Sheets are generated in worker threads so the loop keeps answering,
+        requests for a sheet already being generated share that run.
+    '''
+    def __init__(self, cacheBytes=64<<20, window=4096, maxBars=1<<14, maxBook=256, maxBody=1<<16):
+        self.lru = SheetLRU(cacheBytes)
+        # what one request may ask for: bars of a sheet, exercises of a
+        # book, bytes of the json body
+        self.maxBars, self.maxBook, self.maxBody = maxBars, maxBook, maxBody
+        self.metrics = Metrics(window)
+        # configKey --> future of the sheet being generated
+        self.running = {}
+
+    async def sheet(self, params):
+        ''' (outcome, configKey, .ly bytes) of a /sheet request, outcome is
+            'hits', 'misses' or 'shared'
+        '''
+        gen, book, bars = buildGen(params, self.maxBars, self.maxBook)
+        key = requestKey(gen, book, bars)
+        if gen.seed is None:
+            body = await asyncio.get_running_loop().run_in_executor(None, generate, gen, book, bars)
+            return 'misses', key, body
+        body = self.lru.get(key)
+        if body is not None:
+            return 'hits', key, body
+        if key in self.running:
+            return 'shared', key, await asyncio.shield(self.running[key])
+        future = asyncio.get_running_loop().run_in_executor(None, generate, gen, book, bars)
+        self.running[key] = future
+        try:
+            body = await future
+        finally:
+            del self.running[key]
+        self.lru.put(key, body)
+        return 'misses', key, body
+
+    async def respond(self, method, path, body):
+        ''' (status, content type, extra headers, body) of a request '''
+        if path == '/health' and method == 'GET':
+            return 200, 'text/plain', {}, b'ok\n'
+        if path == '/metrics' and method == 'GET':
+            return 200, 'application/json', {}, json.dumps(self.metrics.report(self.lru)).encode()
+        if path != '/sheet':
+            return 404, 'text/plain', {}, b'not found\n'
+        if method != 'POST':
+            return 405, 'text/plain', {'Allow':'POST'}, b'POST json parameters to /sheet\n'
+
+        start = time.perf_counter()
+        try:
+            params = json.loads(body or b'{}')
+            outcome, key, sheet = await self.sheet(params)
+        except (ValueError, BadRequest) as e:
+            # json errors are ValueErrors too
+            self.metrics.record(time.perf_counter() - start, 'errors')
+            return 400, 'text/plain', {}, ('%s\n' % e).encode()
+        except Exception as e:
+            # a bug, not the request: answer it all the same and keep serving
+            traceback.print_exc()
+            self.metrics.record(time.perf_counter() - start, 'errors')
+            return 500, 'text/plain', {}, ('%s: %s\n' % (type(e).__name__, e)).encode()
+        self.metrics.record(time.perf_counter() - start, outcome)
+        return 200, 'text/x-lilypond; charset=utf-8', {'X-Config-Key':key,
+                'X-Cache':{'hits':'hit', 'misses':'miss', 'shared':'shared'}[outcome]}, sheet
+
+    async def handle(self, reader, writer):
+        ''' serve the requests of one connection, keep-alive unless the
+            client says close or speaks HTTP/1.0
+        '''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, path, version = line.decode('latin-1').split()
+                except ValueError:
+                    self.metrics.record(0.0, 'errors')
+                    await self.send(writer, 400, 'text/plain', {}, b'bad request line\n', False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length', '0')
+                if not length.isdigit():
+                    # the body cannot be skipped, the connection ends here
+                    self.metrics.record(0.0, 'errors')
+                    await self.send(writer, 400, 'text/plain', {}, b'bad content-length\n', False)
+                    break
+                if int(length) > self.maxBody:
+                    self.metrics.record(0.0, 'errors')
+                    await self.send(writer, 413, 'text/plain', {},
+                                    b'body over %d bytes\n' % self.maxBody, False)
+                    break
+                body = await reader.readexactly(int(length))
+                keepAlive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                status, contentType, extra, payload = await self.respond(method, path.split('?')[0], body)
+                await self.send(writer, status, contentType, extra, payload, keepAlive)
+                if not keepAlive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    REASONS = {200:'OK', 400:'Bad Request', 404:'Not Found', 405:'Method Not Allowed',
+               413:'Payload Too Large', 500:'Internal Server Error'}
+
+    async def send(self, writer, status, contentType, extra, payload, keepAlive):
+        head = ['HTTP/1.1 %d %s' % (status, SheetServer.REASONS[status]),
+                'Content-Type: %s' % contentType, 'Content-Length: %d' % len(payload),
+                'Connection: %s' % ('keep-alive' if keepAlive else 'close')]
+        head += ['%s: %s' % item for item in extra.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        writer.write(payload)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8088, unix=None):
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        for sock in server.sockets:
+            print("serving on %s" % (sock.getsockname(),), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve gen8.py sheets over HTTP",
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--unix', default=None, metavar='PATH', help='listen on this Unix socket instead')
+    parser.add_argument('--cache-size', type=int, default=64, help='in memory sheet cache in MB, default 64')
+    parser.add_argument('--window', type=int, default=4096, help='requests the latency percentiles cover')
+    parser.add_argument('--max-bars', type=int, default=1<<14, help='bars of a sheet a request may ask for, default 16384')
+    parser.add_argument('--max-book', type=int, default=256, help='exercises of a book a request may ask for, default 256')
+    parser.add_argument('--max-body', type=int, default=1<<16, help='bytes of a request body, default 65536')
+    parser.epilog = '''
+    curl -d '{"format": "2Treble", "Treble": [21, 25], "number": 32, "seed": 7}' localhost:8088/sheet
+    curl -d '{"argv": ["-P", "1To5", "--seed", "7"]}' localhost:8088/sheet
+    curl localhost:8088/metrics
+    '''
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(SheetServer(args.cache_size<<20, args.window, args.max_bars,
+                                        args.max_book, args.max_body).serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
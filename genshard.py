@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+# the program is to put the shards of a book made with gen8.py --shard K/N back together
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+
+def readManifests(paths):
+    ''' the shard manifests (OUTPUT.shard.json) of paths in shard order,
+        a path may name the manifest or the shard output itself. Raises
+        ValueError unless they are all N shards of one book
+    '''
+    manifests = []
+    for path in paths:
+        if not path.endswith('.shard.json'):
+            path += '.shard.json'
+        with open(path) as f:
+            manifest = json.load(f)
+        # the output is next to its manifest
+        manifest['path'] = os.path.join(os.path.dirname(path), manifest['output'])
+        manifests.append(manifest)
+    if not manifests:
+        raise ValueError("no shards")
+    manifests.sort(key=lambda m: m['shard'])
+    books = set((m['book'], m['shards']) for m in manifests)
+    if len(books) != 1:
+        raise ValueError("shards of different books: %s" % ', '.join(sorted(set(m['book'][:12] for m in manifests))))
+    shards = [m['shard'] for m in manifests]
+    n = manifests[0]['shards']
+    if shards != list(range(1, n+1)):
+        missing = sorted(set(range(1, n+1)) - set(shards))
+        raise ValueError("need shards 1..%d once each, missing %s" % (n, missing or 'none, some repeat'))
+    return manifests
+
+def checkShard(manifest):
+    ''' raise ValueError when the output of manifest is not the one written '''
+    digest = hashlib.sha1()
+    with open(manifest['path'], 'rb') as f:
+        for block in iter(lambda: f.read(1<<16), b''):
+            digest.update(block)
+    if digest.hexdigest() != manifest['sha1']:
+        raise ValueError("%s changed since shard %d/%d wrote it"
+                         % (manifest['path'], manifest['shard'], manifest['shards']))
+
+def mergeShards(manifests, output):
+    ''' concatenate the outputs of the shard manifests into output, the
+        same bytes a single gen8.py --book run writes
+    '''
+    for manifest in manifests:
+        checkShard(manifest)
+    # write next to the target and rename, a failed merge never leaves half a book
+    part = output + '.part'
+    with open(part, 'wb') as out:
+        for manifest in manifests:
+            with open(manifest['path'], 'rb') as f:
+                shutil.copyfileobj(f, out, 1<<16)
+    os.replace(part, output)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Merge the shards of a gen8.py --book --shard K/N run")
+    parser.add_argument('shards', nargs='+', help='shard outputs or their .shard.json manifests')
+    parser.add_argument('-o', '--output', required=True, help='the merged book')
+    parser.epilog = '''
+    ./gen8.py -p 1 --seed 7 --book 1000 --shard 1/2 -o part1.ly    (node 1)
+    ./gen8.py -p 1 --seed 7 --book 1000 --shard 2/2 -o part2.ly    (node 2)
+    ./genshard.py part1.ly part2.ly -o book.ly
+    '''
+    args = parser.parse_args()
+
+    try:
+        manifests = readManifests(args.shards)
+        mergeShards(manifests, args.output)
+    except (OSError, ValueError) as e:
+        print("genshard.py: %s" % e, file=sys.stderr)
+        sys.exit(1)
+    print("%s: %d shards, %d exercises, book %s" % (args.output, len(manifests),
+                                                   manifests[0]['count'], manifests[0]['book'][:12]))
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+
+# the program is to write one generated sheet to several outputs at once: SightGen.genSheet(sinks=[...])
+import json
+
+from gen8 import SightGen, Sheet, Staff
+import genmidi
+import genxml
+import gensvg
+
+# a sink gets begin(gen) once, then bar(k, bars) for every bar k (from 0)
+# with the (TN indexes, DURATIONS codes, LilyPond text) of each staff, then
+# end(). What a sink cannot write yet it keeps as compact Staff arrays.
+
+class StaffBuffer:
+    ''' fills a Staff bar by bar, CHUNK bars at a time '''
+    def __init__(self, name):
+        self.staff = Staff(name)
+        self.pitches, self.durations, self.lengths = [], [], []
+
+    def add(self, pitches, durations):
+        self.pitches.extend(pitches)
+        self.durations.extend(durations)
+        self.lengths.append(len(pitches))
+        if len(self.lengths) == SightGen.CHUNK:
+            self.flush()
+
+    def flush(self):
+        ''' the Staff with every bar added so far '''
+        if self.lengths:
+            self.staff.extend(self.pitches, self.durations, self.lengths)
+            self.pitches, self.durations, self.lengths = [], [], []
+        return self.staff
+
+class LilypondSink:
+    ''' the .ly file of the format, the same text as streamSheet. The first
+        staff is written as it comes, the others once it is done
+    '''
+    def __init__(self, out):
+        self.out = out
+
+    def begin(self, gen):
+        self.pieces = SightGen.FORMAT_TEMPLATE[gen.format].split('%s')
+        self.barPerLine = gen.barPerLine
+        self.later = [StaffBuffer(plan.name) for plan in gen.plans()[1:]]
+        self.out.write(self.pieces[0])
+        self.out.write(gen.signature())
+        self.out.write(self.pieces[1])
+
+    def bar(self, k, bars):
+        # same spacing as ' '.join of the bars and their '\break's
+        self.out.write(bars[0][2] if k == 0 else ' ' + bars[0][2])
+        if self.barPerLine != 0 and (k+1) % self.barPerLine == 0:
+            self.out.write(' \\break')
+        for staff, (pitches, durations, _) in zip(self.later, bars[1:]):
+            staff.add(pitches, durations)
+
+    def end(self):
+        for staff, piece in zip(self.later, self.pieces[2:]):
+            self.out.write(piece)
+            sep = ''
+            for text in staff.flush().iterBars(self.barPerLine):
+                self.out.write(sep)
+                self.out.write(text)
+                sep = ' '
+        self.out.write(self.pieces[-1])
+        self.out.write('\n')
+
+class SheetSink:
+    ''' collects the bars into a Sheet and hands it to write() at the end,
+        for outputs that need a whole staff before they can start
+    '''
+    def begin(self, gen):
+        self.sheet = Sheet(gen.format, gen.time, gen.unit, gen.barPerLine)
+        self.staffs = [StaffBuffer(plan.name) for plan in gen.plans()]
+
+    def bar(self, k, bars):
+        for staff, (pitches, durations, _) in zip(self.staffs, bars):
+            staff.add(pitches, durations)
+
+    def end(self):
+        self.sheet.staffs = [staff.flush() for staff in self.staffs]
+        self.write(self.sheet)
+
+class MidiSink(SheetSink):
+    ''' Standard MIDI File, see genmidi.writeMidi '''
+    def __init__(self, out, tempo=96, velocity=80):
+        self.out = out
+        self.tempo, self.velocity = tempo, velocity
+
+    def write(self, sheet):
+        genmidi.writeMidi(sheet, self.out, self.tempo, self.velocity)
+
+class SvgSink(SheetSink):
+    ''' quick preview image, see gensvg.writeSvg '''
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, sheet):
+        gensvg.writeSvg(sheet, self.out)
+
+class MusicXMLSink:
+    ''' MusicXML, see genxml. The measures of the first part are written
+        as they come, the other parts (2Treble) once it is done
+    '''
+    def __init__(self, out):
+        self.out = out
+
+    def begin(self, gen):
+        parts = genxml.PARTS[gen.format]
+        self.writers = [genxml.PartWriter(clefs, gen.time, gen.unit, gen.barPerLine) for _, clefs in parts]
+        self.first = len(parts[0][1])
+        self.later = [StaffBuffer(plan.name) for plan in gen.plans()[self.first:]]
+        genxml.writeHeader(self.out, gen.format)
+        self.out.write('  <part id="P1">\n')
+
+    def bar(self, k, bars):
+        self.out.write(self.writers[0].measure(k, [bar[:2] for bar in bars[:self.first]]))
+        for staff, (pitches, durations, _) in zip(self.later, bars[self.first:]):
+            staff.add(pitches, durations)
+
+    def end(self):
+        self.out.write('  </part>\n')
+        staffs = iter([staff.flush() for staff in self.later])
+        for k, writer in enumerate(self.writers[1:], 2):
+            bars = [map(staff.bar, range(0, staff.numBars())) for staff in
+                    [next(staffs) for clef in writer.clefs]]
+            self.out.write('  <part id="P%d">\n' % k)
+            for m, bar in enumerate(zip(*bars)):
+                self.out.write(writer.measure(m, bar))
+            self.out.write('  </part>\n')
+        self.out.write(genxml.FOOTER)
+
+class AnswerKeySink:
+    ''' one line per bar: the bar number, then the notes of each staff in
+        scientific names (C4 is middle C), '-' for a rest. The rhythm staff
+        lists its durations instead
+    '''
+    NAMES = [genxml.STEPS[i % 7] + str(genxml.LOWEST_OCTAVE + i // 7) for i in range(0, len(SightGen.TN))]
+
+    def __init__(self, out):
+        self.out = out
+
+    def begin(self, gen):
+        self.names = [plan.name for plan in gen.plans()]
+        self.out.write('# %s %s, %d bars: %s\n' % (gen.format, gen.signature(), gen.numBars,
+                                                   ' | '.join(self.names)))
+
+    def bar(self, k, bars):
+        names, rest, durations = AnswerKeySink.NAMES, SightGen.REST, SightGen.DURATIONS
+        staffs = []
+        for name, (pitches, codes, _) in zip(self.names, bars):
+            if name == 'rhythm':
+                staffs.append(' '.join([durations[d] for d in codes]))
+            else:
+                staffs.append(' '.join([names[p] if d < rest else '-' for p, d in zip(pitches, codes)]))
+        self.out.write('%d: %s\n' % (k+1, ' | '.join(staffs)))
+
+    def end(self):
+        pass
+
+class JsonSink:
+    ''' the sheet as json, bar by bar:
+            {"format":, "time":, "barPerLine":, "staffs": [names],
+             "bars": [[[[pitch, duration], ...] of each staff], ...]}
+        in LilyPond names, pitch null for a rest
+    '''
+    # json of every (TN index, DURATIONS code) note
+    NOTES = [[json.dumps([pitch if d < SightGen.REST else None, duration])
+              for d, duration in enumerate(SightGen.DURATIONS)] for pitch in SightGen.TN]
+
+    def __init__(self, out):
+        self.out = out
+
+    def begin(self, gen):
+        head = json.dumps({'format':gen.format, 'time':gen.signature(), 'barPerLine':gen.barPerLine,
+                           'staffs':[plan.name for plan in gen.plans()]})
+        # the bars go in before the closing brace
+        self.out.write(head[:-1] + ', "bars": [')
+
+    def bar(self, k, bars):
+        notes = JsonSink.NOTES
+        self.out.write(('\n[' if k == 0 else ',\n[') +
+                       ', '.join(['[' + ', '.join([notes[p][d] for p, d in zip(pitches, codes)]) + ']'
+                                  for pitches, codes, _ in bars]) + ']')
+
+    def end(self):
+        self.out.write(']}\n')
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# the program is to draw a quick SVG preview of a generated sheet without lilypond
+import sys
+from functools import lru_cache
+
+from gen8 import SightGen
+from rhythm import durationLength
+
+# distance between two staff lines, everything else is measured in it
+SPACE = 8
+# width of a sixteenth, a bar is as wide as its notes plus padding
+SIXTEENTH = 1.6 * SPACE
+BAR_PAD = 2 * SPACE
+MARGIN = 3 * SPACE
+# room for the clef and the time signature at the start of a line
+HEAD = 7 * SPACE
+# room above and below a staff for ledger lines and stems
+ABOVE, BELOW = 5 * SPACE, 5 * SPACE
+STAFF_HEIGHT = 4 * SPACE
+# bars per line when the sheet has no line breaks
+LINE_BARS = 4
+
+# TN index of the bottom line and the glyph of each clef
+CLEFS = {'treble':(SightGen.TN.index("e'"), '\U0001D11E'), 'bass':(SightGen.TN.index("g,"), '\U0001D122')}
+STAFF_CLEFS = {'Grand':['treble', 'bass'], '2Treble':['treble', 'treble'], 'Beats':['treble']}
+
+STYLE = ('<style>line{stroke:#000;stroke-width:1}.s{stroke-width:1.2}.b{stroke-width:1.5}'
+         'ellipse{stroke:#000;stroke-width:1.3}.o{fill:#fff}rect,circle,path{fill:#000}'
+         'text{font-family:serif}</style>\n')
+
+@lru_cache(maxsize=None)
+def noteSvg(bottom, pitch, duration):
+    ''' the notehead, stem, flags, dot and ledger lines of TN index pitch
+        with DURATIONS code duration around (0, 0) = bottom staff line, as
+        an svg fragment. Drawn once for each note and moved with translate
+    '''
+    name = SightGen.DURATIONS[duration]
+    base = name.lstrip('r').rstrip('.')
+    dotted = name.endswith('.')
+    half = SPACE / 2.0
+    if duration >= SightGen.REST:
+        return restSvg(base, dotted)
+    # staff position, 0 the bottom line, 8 the top line
+    position = pitch - bottom
+    y = -position * half
+    rx, ry = 0.65 * SPACE, 0.45 * SPACE
+    parts = []
+    for ledger in list(range(-2, position - 1, -2)) + list(range(10, position + 1, 2)):
+        parts.append('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f"/>' % (-rx - 3, -ledger * half, rx + 3, -ledger * half))
+    hollow = base in ('1', '2')
+    parts.append('<ellipse%s cx="0" cy="%.1f" rx="%.1f" ry="%.1f" transform="rotate(-20 0 %.1f)"/>'
+                 % (' class="o"' if hollow else '', y, rx, ry, y))
+    if base != '1':
+        # stems go up below the middle line and down from it
+        up = position < 4
+        x = rx - 0.6 if up else -rx + 0.6
+        end = y - 3.5 * SPACE if up else y + 3.5 * SPACE
+        parts.append('<line class="s" x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f"/>' % (x, y, x, end))
+        for flag in range(0, {'8':1, '16':2}.get(base, 0)):
+            start = end + (flag * 0.8 * SPACE if up else -flag * 0.8 * SPACE)
+            parts.append('<line class="b" x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f"/>'
+                         % (x, start, x + SPACE, start + (1.5 * SPACE if up else -1.5 * SPACE)))
+    if dotted:
+        # a dot on a line moves up into the space
+        parts.append('<circle cx="%.1f" cy="%.1f" r="1.6"/>' % (rx + 4, y - half if position % 2 == 0 else y))
+    return ''.join(parts)
+
+def restSvg(base, dotted):
+    ''' a rest of duration base on the middle of the staff '''
+    if base == '1':
+        # hangs from the fourth line
+        rest = '<rect x="-5" y="%.1f" width="10" height="%.1f"/>' % (-3 * SPACE, SPACE / 2.0)
+    elif base == '2':
+        # sits on the middle line
+        rest = '<rect x="-5" y="%.1f" width="10" height="%.1f"/>' % (-2.5 * SPACE, SPACE / 2.0)
+    elif base == '4':
+        rest = ('<path d="M-2 %.1f l5 6 l-4 5 l5 6 l-6 -3 l-1 4 z"/>' % (-3.4 * SPACE))
+    else:
+        flags = {'8':1, '16':2}[base]
+        rest = ''.join('<circle cx="-2.5" cy="%.1f" r="2"/>' % (-2.6 * SPACE + k * 0.9 * SPACE)
+                       for k in range(0, flags))
+        rest += '<line class="s" x1="3" y1="%.1f" x2="-1" y2="%.1f"/>' % (-2.8 * SPACE, -1.2 * SPACE + flags * 0.4 * SPACE)
+    if dotted:
+        rest += '<circle cx="8" cy="%.1f" r="1.6"/>' % (-2.5 * SPACE)
+    return rest
+
+def barWidth(sheet):
+    return sheet.time * 16 // sheet.unit * SIXTEENTH + BAR_PAD
+
+def writeSvg(sheet, out):
+    ''' write a preview of sheet as an svg image to the text file object
+        out, a line of barPerLine bars (LINE_BARS when 0) per system
+    '''
+    staffClefs = STAFF_CLEFS[sheet.format]
+    lineBars = sheet.barPerLine or LINE_BARS
+    numBars = sheet.numBars()
+    systems = max(1, -(-numBars // lineBars))
+    staffHeight = ABOVE + STAFF_HEIGHT + BELOW
+    systemHeight = staffHeight * len(staffClefs) + 2 * SPACE
+    width = 2 * MARGIN + HEAD + lineBars * barWidth(sheet)
+    height = 2 * MARGIN + systems * systemHeight
+    out.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n'
+              % (width, height, width, height))
+    out.write(STYLE)
+    out.write('<rect x="0" y="0" width="%d" height="%d" style="fill:#fff"/>\n' % (width, height))
+
+    ticks = [durationLength(d) for d in SightGen.DURATIONS]
+    bw = barWidth(sheet)
+    for system in range(0, systems):
+        first = system * lineBars
+        last = min(first + lineBars, numBars)
+        top = MARGIN + system * systemHeight
+        right = MARGIN + HEAD + (last - first) * bw
+        parts = []
+        for s, (staff, clef) in enumerate(zip(sheet.staffs, staffClefs)):
+            bottom, glyph = CLEFS[clef]
+            # y of the bottom line
+            base = top + s * staffHeight + ABOVE + STAFF_HEIGHT
+            for line in range(0, 5):
+                y = base - line * SPACE
+                parts.append('<line x1="%d" y1="%d" x2="%.1f" y2="%d"/>' % (MARGIN, y, right, y))
+            parts.append('<text x="%d" y="%.1f" font-size="%d">%s</text>'
+                         % (MARGIN + 2, base - (0.4 if clef == 'treble' else 1.3) * SPACE,
+                            (5 if clef == 'treble' else 4) * SPACE, glyph))
+            if system == 0:
+                for k, number in enumerate((sheet.time, sheet.unit)):
+                    parts.append('<text x="%d" y="%.1f" font-size="%d" font-weight="bold">%d</text>'
+                                 % (MARGIN + 4 * SPACE, base - (2 - 2 * k) * SPACE - 1, 2.4 * SPACE, number))
+            x = MARGIN + HEAD
+            pitches, durations = staff.pitches, staff.durations
+            for k in range(first, last):
+                offset = 0
+                for n in range(staff.bars[k], staff.bars[k+1]):
+                    d = durations[n]
+                    parts.append('<g transform="translate(%.1f %d)">%s</g>'
+                                 % (x + SPACE + offset * SIXTEENTH, base, noteSvg(bottom, pitches[n], d)))
+                    offset += ticks[d]
+                x += bw
+                parts.append('<line x1="%.1f" y1="%d" x2="%.1f" y2="%d"/>' % (x, base - STAFF_HEIGHT, x, base))
+        out.write('\n'.join(parts))
+        out.write('\n')
+    out.write('</svg>\n')
+
+if __name__ == "__main__":
+
+    parser = SightGen.argParser()
+    parser.description = "Generate Random Notes As An SVG Preview"
+    args = parser.parse_args()
+    SightGen.rejectOptions(parser, args)
+    if args.book is not None:
+        parser.error("--book makes one LilyPond file, preview the exercises one by one")
+
+    sheet = SightGen.fromArgs(args, parser).buildSheet()
+    out = sys.stdout if args.output is None else open(args.output, 'w', buffering=1<<16)
+    writeSvg(sheet, out)
+    out.flush()
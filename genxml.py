@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# the program is to write generated sheets as MusicXML, measure by measure
+import sys
+
+from gen8 import SightGen
+from rhythm import durationLength
+
+# divisions of a quarter note, a sixteenth is one division
+DIVISIONS = 4
+STEPS = 'CDEFGAB'
+# TN index 0 (c,) is C2
+LOWEST_OCTAVE = 2
+TYPES = {'1':'whole', '2':'half', '4':'quarter', '8':'eighth', '16':'16th'}
+
+# the parts of each format as (part name, [clef of each staff]), a part
+# with two staffs writes both in every measure
+PARTS = {'Grand':[('Piano', ['G2', 'F4'])],
+         '2Treble':[('Treble 1', ['G2']), ('Treble 2', ['G2'])],
+         'Beats':[('Rhythm', ['percussion'])]}
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" "http://www.musicxml.org/dtds/partwise.dtd">
+<score-partwise version="3.1">
+  <part-list>
+%s  </part-list>
+'''
+FOOTER = '''</score-partwise>
+'''
+
+def noteXml(pitch, duration, staff, percussion):
+    ''' the <note> of TN index pitch with DURATIONS code duration, staff is
+        the staff number in a two staff part, None otherwise
+    '''
+    name = SightGen.DURATIONS[duration]
+    if duration >= SightGen.REST:
+        sound = '<rest/>'
+    elif percussion:
+        sound = '<unpitched><display-step>%s</display-step><display-octave>%d</display-octave></unpitched>' % (
+                STEPS[pitch % 7], LOWEST_OCTAVE + pitch // 7)
+    else:
+        sound = '<pitch><step>%s</step><octave>%d</octave></pitch>' % (
+                STEPS[pitch % 7], LOWEST_OCTAVE + pitch // 7)
+    base = name.lstrip('r').rstrip('.')
+    text = '      <note>%s<duration>%d</duration><voice>%d</voice><type>%s</type>%s' % (
+            sound, durationLength(name) * DIVISIONS // 4, staff or 1, TYPES[base],
+            '<dot/>' * (len(name.lstrip('r')) - len(base)))
+    if staff is not None:
+        text += '<staff>%d</staff>' % staff
+    return text + '</note>\n'
+
+def noteTable(staff, percussion):
+    ''' noteXml of every (TN index, DURATIONS code), a note is a lookup '''
+    return [[noteXml(p, d, staff, percussion) for d in range(0, len(SightGen.DURATIONS))]
+            for p in range(0, len(SightGen.TN))]
+
+def clefXml(clef, number):
+    attr = '' if number is None else ' number="%d"' % number
+    if clef == 'percussion':
+        return '<clef%s><sign>percussion</sign></clef>' % attr
+    return '<clef%s><sign>%s</sign><line>%s</line></clef>' % (attr, clef[0], clef[1])
+
+def sheetBars(sheet):
+    ''' (TN indexes, DURATIONS codes) of every bar of each staff of a Sheet '''
+    return [map(staff.bar, range(0, staff.numBars())) for staff in sheet.staffs]
+
+def genBars(gen):
+    ''' (TN indexes, DURATIONS codes) of every bar of each staff of gen,
+        drawn CHUNK bars at a time while they are written
+    '''
+    def bars(plan):
+        for chunk in gen.iterChunks(plan, gen.seed):
+            for _, pitches, form in chunk:
+                yield pitches, plan.forms[form]
+    return [bars(plan) for plan in gen.plans()]
+
+def writeHeader(out, format):
+    ''' the xml declaration, doctype and part list of format '''
+    out.write(HEADER % ''.join('    <score-part id="P%d"><part-name>%s</part-name></score-part>\n'
+                               % (k+1, name) for k, (name, _) in enumerate(PARTS[format])))
+
+class PartWriter:
+    ''' turns the bars of the staffs of one part into <measure>s
+            clefs   --> clef of each staff of the part
+            numbers --> <staff> number of each staff, None in a one staff part
+            tables  --> noteTable of each staff
+    '''
+    def __init__(self, clefs, time, unit, barPerLine):
+        self.clefs = clefs
+        self.time, self.unit = time, unit
+        self.barPerLine = barPerLine
+        self.numbers = [None] if len(clefs) == 1 else list(range(1, len(clefs) + 1))
+        self.tables = [noteTable(number, clefs == ['percussion']) for number in self.numbers]
+        self.barLength = time * 16 // unit * DIVISIONS // 4
+
+    def measure(self, m, bars):
+        ''' the <measure> of bar m (from 0), bars holds the (TN indexes,
+            DURATIONS codes) of each staff
+        '''
+        clefs = self.clefs
+        measure = ['    <measure number="%d">\n' % (m+1)]
+        if m == 0:
+            measure.append('      <attributes><divisions>%d</divisions><key><fifths>0</fifths></key>'
+                           '<time><beats>%d</beats><beat-type>%d</beat-type></time>%s%s</attributes>\n'
+                           % (DIVISIONS, self.time, self.unit,
+                              '' if len(clefs) == 1 else '<staves>%d</staves>' % len(clefs),
+                              ''.join(clefXml(clef, n) for clef, n in zip(clefs, self.numbers))))
+        elif self.barPerLine != 0 and m % self.barPerLine == 0:
+            measure.append('      <print new-system="yes"/>\n')
+        for s, (pitches, durations) in enumerate(bars):
+            if s > 0:
+                # back to the start of the measure for the next staff
+                measure.append('      <backup><duration>%d</duration></backup>\n' % self.barLength)
+            table = self.tables[s]
+            measure.extend([table[p][d] for p, d in zip(pitches, durations)])
+        measure.append('    </measure>\n')
+        return ''.join(measure)
+
+def writeParts(out, format, time, unit, barPerLine, staffBars):
+    ''' write the score of format to out, staffBars holds one iterable of
+        bars per staff. A part is written measure by measure, its staffs in
+        step, so only the current measure is held in memory
+    '''
+    writeHeader(out, format)
+    staffBars = iter(staffBars)
+    for k, (name, clefs) in enumerate(PARTS[format]):
+        part = PartWriter(clefs, time, unit, barPerLine)
+        staffs = [next(staffBars) for clef in clefs]
+        out.write('  <part id="P%d">\n' % (k+1))
+        for m, bars in enumerate(zip(*staffs)):
+            out.write(part.measure(m, bars))
+        out.write('  </part>\n')
+    out.write(FOOTER)
+
+def writeMusicXML(sheet, out):
+    ''' write a Sheet as MusicXML to the text file object out '''
+    writeParts(out, sheet.format, sheet.time, sheet.unit, sheet.barPerLine, sheetBars(sheet))
+
+def streamMusicXML(gen, out):
+    ''' generate the sheet of gen straight into MusicXML, no Sheet is kept
+        so the memory stays flat for any number of bars
+    '''
+    writeParts(out, gen.format, gen.time, gen.unit, gen.barPerLine, genBars(gen))
+
+if __name__ == "__main__":
+
+    parser = SightGen.argParser()
+    parser.description = "Generate Random Notes As MusicXML"
+    args = parser.parse_args()
+    SightGen.rejectOptions(parser, args)
+    if args.book is not None:
+        parser.error("--book makes one LilyPond file, generate the exercises one by one for MusicXML")
+
+    gen = SightGen.fromArgs(args, parser)
+    out = sys.stdout if args.output is None else open(args.output, 'w', buffering=1<<16)
+    streamMusicXML(gen, out)
+    out.flush()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+# the program is to work out the rhythm forms of a bar: every way to fill a
+# time signature with a set of durations, and to draw them by weight
+import math
+import random
+from functools import lru_cache
+
+# a sixteenth is the shortest duration, lengths are in sixteenths
+SIXTEENTHS = 16
+
+def durationLength(duration):
+    ''' length in sixteenths of a LilyPond duration: '4', '2.', 'r8' ... '''
+    text = duration.lstrip('r')
+    base = text.rstrip('.')
+    if base not in ('1', '2', '4', '8', '16'):
+        raise ValueError("unknown duration %r" % (duration,))
+    length = SIXTEENTHS // int(base)
+    # every dot adds half of what the previous one added
+    add = length
+    for dot in text[len(base):]:
+        add //= 2
+        if add == 0:
+            raise ValueError("duration %r is shorter than a sixteenth" % (duration,))
+        length += add
+    return length
+
+def barLength(beats, unit):
+    ''' length in sixteenths of a bar of beats/unit '''
+    if unit not in (1, 2, 4, 8, 16) or beats <= 0:
+        raise ValueError("unsupported time signature %s/%s" % (beats, unit))
+    return beats * SIXTEENTHS // unit
+
+@lru_cache(maxsize=None)
+def countForms(length, lengths):
+    ''' number of ordered ways to fill length with the tuple lengths '''
+    if length == 0:
+        return 1
+    return sum(countForms(length - l, lengths) for l in lengths if l <= length)
+
+@lru_cache(maxsize=256)
+def _forms(length, durations):
+    # forms of length as tuples of durations, each suffix is enumerated once
+    if length == 0:
+        return ((),)
+    forms = []
+    for duration in durations:
+        rest = length - durationLength(duration)
+        if rest >= 0:
+            forms.extend((duration,) + form for form in _forms(rest, durations))
+    return tuple(forms)
+
+def barForms(beats, unit, durations, limit=1<<16):
+    ''' every rhythm form of a beats/unit bar made of durations, as lists of
+        durations in the R4Dict layout. Raises ValueError when there is no
+        form or more than limit of them
+    '''
+    durations = tuple(durations)
+    length = barLength(beats, unit)
+    count = countForms(length, tuple(durationLength(d) for d in durations))
+    if count == 0:
+        raise ValueError("no form of %s fills a %s/%s bar" % (' '.join(durations), beats, unit))
+    if count > limit:
+        raise ValueError("%d forms of %s fill a %s/%s bar, more than %d"
+                         % (count, ' '.join(durations), beats, unit, limit))
+    return [list(form) for form in _forms(length, durations)]
+
+class AliasTable:
+    ''' Walker's alias table: draws index i with probability
+        weights[i]/sum(weights) with one random() whatever the number of
+        weights, after an O(n) set up
+            prob  --> chance of keeping the column, scaled by the column count
+            alias --> index taken otherwise
+    '''
+    __slots__ = ('prob', 'alias')
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0 or min(weights) < 0:
+            raise ValueError("weights need to be non negative with a positive sum")
+        # an inf or nan total would scale every weight to nan
+        if not math.isfinite(total):
+            raise ValueError("weights need a finite sum, got %s" % total)
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(0, n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # what is left is 1 give or take rounding, it keeps its column
+
+    def draw(self, rng=random, k=1):
+        ''' k indexes drawn with rng '''
+        prob, alias, n = self.prob, self.alias, len(self.prob)
+        random = rng.random
+        picks = []
+        for i in range(0, k):
+            # the integer part picks the column, the fraction decides
+            x = random() * n
+            column = int(x)
+            picks.append(column if x - column < prob[column] else alias[column])
+        return picks
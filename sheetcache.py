@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+# content addressed on-disk cache of generated sheets and their rendered files
+import os
+import shutil
+
+class SheetCache:
+    ''' files stored under a key (SightGen.configKey()):
+            <directory>/<key[:2]>/<key>/<name>
+        name is 'sheet.ly' for the text, and for a rendered file what the
+        caller names it: genbatch.py stores 'render' and the suffix after
+        the output base ('render.pdf', 'render-1.png'). A lookup is a single
+        path check. The modification time of an entry is its last use, the
+        least recently used entries go first once the cache holds more than
+        maxBytes.
+    '''
+    SHEET = 'sheet.ly'
+
+    def __init__(self, directory, maxBytes=256<<20):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        # bytes in the cache, counted on the first store
+        self.size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, name=SHEET):
+        ''' path of the cached file, None on a miss '''
+        path = os.path.join(self.entry(key), name)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(self.entry(key))
+        except OSError:
+            # evicted by another process in between
+            return None
+        return path
+
+    def names(self, key):
+        ''' names stored under key '''
+        try:
+            return sorted(n for n in os.listdir(self.entry(key)) if not n.endswith('.part'))
+        except FileNotFoundError:
+            return []
+
+    def put(self, key, name, src):
+        ''' copy the file src into the cache, returns the cached path '''
+        entry = self.entry(key)
+        os.makedirs(entry, exist_ok=True)
+        path = os.path.join(entry, name)
+        part = path + '.part'
+        shutil.copyfile(src, part)
+        return self.commit(key, part, path)
+
+    def open(self, key, name=SHEET):
+        ''' text file to write a new cached file into, commit it with
+            commit(key, f.name, path) once closed
+        '''
+        entry = self.entry(key)
+        os.makedirs(entry, exist_ok=True)
+        return open(os.path.join(entry, name) + '.part', 'w', buffering=1<<16)
+
+    def commit(self, key, part, path=None):
+        path = path or part[:-len('.part')]
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(part, path)
+        os.utime(self.entry(key))
+        if self.size is None:
+            self.size = self.usage()
+        else:
+            self.size += os.path.getsize(path) - old
+        if self.size > self.maxBytes:
+            self.evict(key)
+        return path
+
+    def usage(self):
+        return sum(size for _, _, size in self.entries())
+
+    def entries(self):
+        ''' (last use, entry path, bytes) of every entry '''
+        result = []
+        for top in os.listdir(self.directory):
+            topPath = os.path.join(self.directory, top)
+            if not os.path.isdir(topPath):
+                continue
+            for key in os.listdir(topPath):
+                entry = os.path.join(topPath, key)
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, n)) for n in os.listdir(entry))
+                    result.append((os.path.getmtime(entry), entry, size))
+                except FileNotFoundError:
+                    pass
+        return result
+
+    def evict(self, keep=None):
+        ''' drop the least recently used entries until the cache fits,
+            the entry of the key keep stays even if it alone is too big
+        '''
+        entries = sorted(self.entries())
+        self.size = sum(size for _, _, size in entries)
+        keepPath = None if keep is None else self.entry(keep)
+        for _, entry, size in entries:
+            if self.size <= self.maxBytes:
+                break
+            if entry == keepPath:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            self.size -= size
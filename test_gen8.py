@@ -0,0 +1,82 @@
+# properties of gen8.py drawing that hold for any seed: run with python -m pytest test_gen8.py
+import io
+import os
+import sys
+import subprocess
+
+import pytest
+
+import genshard
+from gen8 import SightGen
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# two notes, where a redraw swaps the slots of a chunk, a few, and rests
+CASES = [['-T', '16', '17', '-B', '3', '4'],
+         ['-T', '7', '11', '-B', '0', '4'],
+         ['-T', '14', '15', '-d', '4', 'r4', '8', '-B', '2', '6', '-l', '7', '7']]
+
+# chunk edges of SightGen.CHUNK bars
+EDGES = [SightGen.CHUNK - 1, SightGen.CHUNK, SightGen.CHUNK + 1]
+
+def makeGen(argv):
+    parser = SightGen.argParser()
+    return SightGen.fromArgs(parser.parse_args(argv), parser)
+
+def staffBars(sheet, first=0, last=None):
+    ''' (pitches, durations) of bars first..last-1 of each staff '''
+    return [[staff.bar(k) for k in range(first, staff.numBars() if last is None else last)]
+            for staff in sheet.staffs]
+
+@pytest.mark.parametrize('argv', CASES)
+@pytest.mark.parametrize('bars', EDGES)
+@pytest.mark.parametrize('seed', [1, 7, 2024])
+def testUniqueNotes(argv, bars, seed):
+    ''' with -u no two notes in a row of a staff are equal, rests left
+        out, across the chunk edges too
+    '''
+    sheet = makeGen(argv + ['-u', '-n', str(bars)]).generate(seed)
+    for staff in sheet.staffs:
+        assert staff.numBars() == bars
+        notes = [p for p, d in zip(staff.pitches, staff.durations) if d < SightGen.REST]
+        assert all(a != b for a, b in zip(notes, notes[1:]))
+
+@pytest.mark.parametrize('argv', CASES)
+@pytest.mark.parametrize('unique', [[], ['-u']])
+@pytest.mark.parametrize('first,last', [(0, 1), (500, 520), (511, 513), (512, 1024), (1000, 1100)])
+def testBarRange(argv, unique, first, last):
+    ''' generate(seed, first, last) is the same bars of the whole sheet '''
+    gen = makeGen(argv + unique + ['-n', '1100'])
+    whole = staffBars(gen.generate(5))
+    part = gen.generate(5, first, last)
+    assert staffBars(part) == [bars[first:last] for bars in whole]
+
+@pytest.mark.parametrize('argv', CASES[:2])
+def testTableLimit(argv):
+    ''' --table-limit 0 draws bars as the table lookup does '''
+    def text(limit):
+        saved = SightGen.TABLE_LIMIT
+        SightGen.TABLE_LIMIT = limit
+        try:
+            gen = makeGen(argv + ['-u', '-n', str(SightGen.CHUNK + 1), '-b', '4', '--seed', '3'])
+            out = io.StringIO()
+            gen.streamSheet(out)
+            return out.getvalue()
+        finally:
+            SightGen.TABLE_LIMIT = saved
+    assert text(0) == text(SightGen.TABLE_LIMIT)
+
+@pytest.mark.parametrize('count,shards', [(5, 2), (7, 3), (2, 2)])
+def testShardMerge(tmp_path, count, shards):
+    ''' the shards merged by genshard.py are the bytes of a single --book run '''
+    def run(output, *argv):
+        subprocess.run([sys.executable, os.path.join(HERE, 'gen8.py'), '-u', '-n', '12', '--seed', '9',
+                        '--book', str(count), '-o', str(output)] + list(argv), check=True)
+    run(tmp_path / 'book.ly')
+    parts = [str(tmp_path / ('part%d.ly' % k)) for k in range(1, shards+1)]
+    for k, part in enumerate(parts, 1):
+        run(part, '--shard', '%d/%d' % (k, shards))
+    merged = str(tmp_path / 'merged.ly')
+    genshard.mergeShards(genshard.readManifests(parts), merged)
+    with open(merged, 'rb') as f, open(str(tmp_path / 'book.ly'), 'rb') as g:
+        assert f.read() == g.read()